@@ -78,6 +78,22 @@ class CacheManager(object):
     """
     raise NotImplementedError
 
+  def open_reader(self, *labels):
+    # type (*str) -> Optional[Tuple[Generator[Any], coders.Coder]]
+
+    """Returns a (reader, pcoder) tuple for the cache, or None when absent.
+
+    Combines the exists, load_pcoder and read round-trips into a single
+    call so that callers materializing a PCollection hit the cache backend
+    once. Subclasses backed by remote storage may override this with a
+    single-open implementation.
+    """
+    if not self.exists(*labels):
+      return None
+    pcoder = self.load_pcoder(*labels)
+    reader, _ = self.read(*labels)
+    return reader, pcoder
+
   def write(self, value, *labels):
     # type (Any, *str) -> None
 
@@ -69,6 +69,19 @@ class FileBasedCacheManagerTest(object):
     self.mock_write_cache(cache_version_one, prefix, cache_label)
     self.assertTrue(self.cache_manager.exists(prefix, cache_label))
 
+  def test_open_reader(self):
+    """Test that open_reader returns a reader and pcoder in one call."""
+    prefix = 'full'
+    cache_label = 'some-cache-label'
+    cache_version_one = ['cache', 'version', 'one']
+
+    self.assertIsNone(self.cache_manager.open_reader(prefix, cache_label))
+    self.mock_write_cache(cache_version_one, prefix, cache_label)
+    reader, pcoder = self.cache_manager.open_reader(prefix, cache_label)
+    self.assertEqual(
+        pcoder, self.cache_manager.load_pcoder(prefix, cache_label))
+    self.assertListEqual(list(reader), cache_version_one)
+
   def test_empty_label_not_exist(self):
     prefix = 'full'
     cache_label = 'some-cache-label'
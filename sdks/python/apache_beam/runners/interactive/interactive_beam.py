@@ -97,6 +97,7 @@ class Options(interactive_options.InteractiveOptions):
           'consumed from sources in the pipeline. You will not have '
           'replayability until re-enabling this option.')
     self.capture_control._enable_capture_replay = value
+    self._version += 1
 
   @property
   def recordable_sources(self):
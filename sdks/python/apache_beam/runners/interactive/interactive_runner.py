@@ -22,7 +22,11 @@ This module is experimental. No backwards-compatibility guarantees.
 
 # pytype: skip-file
 
+import collections
+import concurrent.futures
+import functools
 import logging
+import weakref
 from typing import Optional
 
 import apache_beam as beam
@@ -31,17 +35,14 @@ from apache_beam.options.pipeline_options import FlinkRunnerOptions
 from apache_beam.options.pipeline_options import GoogleCloudOptions
 from apache_beam.options.pipeline_options import PipelineOptions
 from apache_beam.options.pipeline_options import WorkerOptions
-from apache_beam.pipeline import PipelineVisitor
 from apache_beam.runners.direct import direct_runner
 from apache_beam.runners.interactive import interactive_environment as ie
 from apache_beam.runners.interactive import pipeline_instrument as inst
 from apache_beam.runners.interactive import background_caching_job
 from apache_beam.runners.interactive.dataproc.types import ClusterMetadata
-from apache_beam.runners.interactive.display import pipeline_graph
 from apache_beam.runners.interactive.options import capture_control
 from apache_beam.runners.interactive.utils import to_element_list
 from apache_beam.runners.interactive.utils import watch_sources
-from apache_beam.testing.test_stream_service import TestStreamServiceController
 
 # size of PCollection samples cached.
 SAMPLE_SIZE = 8
@@ -49,11 +50,42 @@ SAMPLE_SIZE = 8
 _LOGGER = logging.getLogger(__name__)
 
 
+def _test_stream_exception_handler(e):
+  _LOGGER.error(str(e))
+  return True
+
+
+@functools.lru_cache(maxsize=16)
+def _strip_protocol_if_any(flink_master: Optional[str]):
+  if not flink_master:
+    return flink_master
+  _, sep, rest = flink_master.partition('://')
+  return rest if sep else flink_master
+
+
 class InteractiveRunner(runners.PipelineRunner):
   """An interactive runner for Beam Python pipelines.
 
   Allows interactively building and running Beam Python pipelines.
   """
+
+  __slots__ = (
+      '_underlying_runner',
+      '_is_flink_runner',
+      '_underlying_enter',
+      '_underlying_exit',
+      '_render_option',
+      '_in_session',
+      '_skip_display',
+      '_force_compute',
+      '_blocking',
+      '_watched_sources_sigs',
+      '_reconstructed_pipelines',
+      '_recording_replay_seen',
+      '_recording_replay_flag',
+      '_executor',
+      '_instruments')
+
   def __init__(
       self,
       underlying_runner=None,
@@ -80,11 +112,48 @@ class InteractiveRunner(runners.PipelineRunner):
     """
     self._underlying_runner = (
         underlying_runner or direct_runner.DirectRunner())
+    # Imported here rather than at module scope so plain interactive
+    # sessions don't pay for the portability runner's transitive imports.
+    try:
+      from apache_beam.runners.portability.flink_runner import FlinkRunner
+      self._is_flink_runner = isinstance(self._underlying_runner, FlinkRunner)
+    except ImportError:
+      self._is_flink_runner = False
+    # Bound session hooks probed once instead of per start/end_session call.
+    self._underlying_enter = getattr(self._underlying_runner, '__enter__', None)
+    self._underlying_exit = getattr(self._underlying_runner, '__exit__', None)
     self._render_option = render_option
     self._in_session = False
     self._skip_display = skip_display
     self._force_compute = force_compute
     self._blocking = blocking
+    # Maps each pipeline to the signature it had when its sources were last
+    # watched, so unchanged pipelines skip the watch_sources graph walk.
+    # Weak keys let entries die with their pipeline instead of accumulating
+    # over a long session (and rule out stale hits via id() reuse).
+    self._watched_sources_sigs = weakref.WeakKeyDictionary()
+    # A small LRU of pipelines reconstructed from instrumented protos so
+    # re-running an unchanged pipeline skips the proto -> Pipeline rebuild.
+    self._reconstructed_pipelines = collections.OrderedDict()
+    # Cached (options identity and version, flag) for the recording replay
+    # option so the options property chain is only traversed on changes.
+    self._recording_replay_seen = None
+    self._recording_replay_flag = True
+    # Overlaps background caching job submission with pipeline
+    # reconstruction in run_pipeline.
+    self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+    # A small LRU of PipelineInstruments keyed by pipeline structure,
+    # options and the computed PCollection state they were built against.
+    self._instruments = collections.OrderedDict()
+
+  @property
+  def is_display_enabled(self):
+    """Whether this runner renders pipeline graphs and display data.
+
+    Callers should consult this cheap guard before building any
+    display-only artifacts such as PipelineGraph instances.
+    """
+    return not self._skip_display
 
   def is_fnapi_compatible(self):
     # TODO(https://github.com/apache/beam/issues/19937):
@@ -106,11 +175,10 @@ class InteractiveRunner(runners.PipelineRunner):
     if self._in_session:
       return
 
-    enter = getattr(self._underlying_runner, '__enter__', None)
-    if enter is not None:
+    if self._underlying_enter is not None:
       _LOGGER.info('Starting session.')
       self._in_session = True
-      enter()
+      self._underlying_enter()
     else:
       _LOGGER.error('Keep alive not supported.')
 
@@ -120,84 +188,130 @@ class InteractiveRunner(runners.PipelineRunner):
     if not self._in_session:
       return
 
-    exit = getattr(self._underlying_runner, '__exit__', None)
-    if exit is not None:
+    if self._underlying_exit is not None:
       self._in_session = False
       _LOGGER.info('Ending session.')
-      exit(None, None, None)
+      self._underlying_exit(None, None, None)
 
   def apply(self, transform, pvalueish, options):
     # TODO(qinyeli, BEAM-646): Remove runner interception of apply.
     return self._underlying_runner.apply(transform, pvalueish, options)
 
   def run_pipeline(self, pipeline, options):
-    if not ie.current_env().options.enable_recording_replay:
+    env = ie.current_env()
+    interactive_opts = env.options
+    opts_seen = (id(interactive_opts), interactive_opts.version)
+    if self._recording_replay_seen != opts_seen:
+      self._recording_replay_flag = interactive_opts.enable_recording_replay
+      self._recording_replay_seen = opts_seen
+    if not self._recording_replay_flag:
       capture_control.evict_captured_data()
     if self._force_compute:
-      ie.current_env().evict_computed_pcollections()
+      env.evict_computed_pcollections()
 
     # Make sure that sources without a user reference are still cached.
-    watch_sources(pipeline)
+    # Watching walks the whole pipeline, so skip it when the pipeline has
+    # not gained any transforms since the last run in this environment.
+    watch_sig = (id(env), frozenset(pipeline.applied_labels))
+    if self._watched_sources_sigs.get(pipeline) != watch_sig:
+      watch_sources(pipeline)
+      self._watched_sources_sigs[pipeline] = watch_sig
 
-    user_pipeline = ie.current_env().user_pipeline(pipeline)
+    user_pipeline = env.user_pipeline(pipeline)
 
-    from apache_beam.runners.portability.flink_runner import FlinkRunner
-    if isinstance(self._underlying_runner, FlinkRunner):
+    if self._is_flink_runner:
       self.configure_for_flink(user_pipeline, options)
 
-    pipeline_instrument = inst.build_pipeline_instrument(pipeline, options)
+    # Building an instrument re-analyzes and re-mutates the whole pipeline;
+    # reuse the previous one when the pipeline, the options and the
+    # computed PCollection state are all unchanged since it was built.
+    instrument_key = (
+        id(env),
+        id(pipeline),
+        len(pipeline.applied_labels),
+        str(options.get_all_options()),
+        frozenset(env.computed_pcollections))
+    pipeline_instrument = self._instruments.get(instrument_key)
+    if pipeline_instrument is None:
+      pipeline_instrument = inst.build_pipeline_instrument(pipeline, options)
+      self._instruments[instrument_key] = pipeline_instrument
+      if len(self._instruments) > 4:
+        self._instruments.popitem(last=False)
+    else:
+      self._instruments.move_to_end(instrument_key)
 
     # The user_pipeline analyzed might be None if the pipeline given has nothing
     # to be cached and tracing back to the user defined pipeline is impossible.
     # When it's None, there is no need to cache including the background
     # caching job and no result to track since no background caching job is
     # started at all.
+    bg_caching_future = None
+    if user_pipeline:
+      # Should use the underlying runner and run asynchronously. The job
+      # submission only needs the user pipeline, so it can overlap with the
+      # proto -> Pipeline reconstruction below.
+      bg_caching_future = self._executor.submit(
+          background_caching_job.attempt_to_run_background_caching_job,
+          self._underlying_runner,
+          user_pipeline,
+          options)
+
+    instrumented_proto = pipeline_instrument.instrumented_pipeline_proto()
+    reconstruction_key = (
+        instrumented_proto.SerializeToString(deterministic=True),
+        id(self._underlying_runner),
+        str(options.get_all_options()))
+    pipeline_to_execute = self._reconstructed_pipelines.get(reconstruction_key)
+    if pipeline_to_execute is None:
+      pipeline_to_execute = beam.pipeline.Pipeline.from_runner_api(
+          instrumented_proto, self._underlying_runner, options)
+      self._reconstructed_pipelines[reconstruction_key] = pipeline_to_execute
+      if len(self._reconstructed_pipelines) > 4:
+        self._reconstructed_pipelines.popitem(last=False)
+    else:
+      self._reconstructed_pipelines.move_to_end(reconstruction_key)
+
+    test_stream_service = None
     if user_pipeline:
-      # Should use the underlying runner and run asynchronously.
-      background_caching_job.attempt_to_run_background_caching_job(
-          self._underlying_runner, user_pipeline, options)
+      # The background caching job must be submitted before the test stream
+      # service state is inspected and the foreground pipeline runs.
+      bg_caching_future.result()
+      test_stream_service = env.get_test_stream_service_controller(
+          user_pipeline)
       if (background_caching_job.has_source_to_cache(user_pipeline) and
           not background_caching_job.is_a_test_stream_service_running(
               user_pipeline)):
-        streaming_cache_manager = ie.current_env().get_cache_manager(
-            user_pipeline)
+        streaming_cache_manager = env.get_cache_manager(user_pipeline)
 
         # Only make the server if it doesn't exist already.
-        if (streaming_cache_manager and
-            not ie.current_env().get_test_stream_service_controller(
-                user_pipeline)):
-
-          def exception_handler(e):
-            _LOGGER.error(str(e))
-            return True
-
+        if streaming_cache_manager and not test_stream_service:
+          from apache_beam.testing.test_stream_service import TestStreamServiceController
           test_stream_service = TestStreamServiceController(
-              streaming_cache_manager, exception_handler=exception_handler)
+              streaming_cache_manager,
+              exception_handler=_test_stream_exception_handler)
           test_stream_service.start()
-          ie.current_env().set_test_stream_service_controller(
+          env.set_test_stream_service_controller(
               user_pipeline, test_stream_service)
 
-    pipeline_to_execute = beam.pipeline.Pipeline.from_runner_api(
-        pipeline_instrument.instrumented_pipeline_proto(),
-        self._underlying_runner,
-        options)
-
-    if ie.current_env().get_test_stream_service_controller(user_pipeline):
-      endpoint = ie.current_env().get_test_stream_service_controller(
-          user_pipeline).endpoint
+    if test_stream_service:
+      endpoint = test_stream_service.endpoint
 
       # TODO: make the StreamingCacheManager and TestStreamServiceController
       # constructed when the InteractiveEnvironment is imported.
-      class TestStreamVisitor(PipelineVisitor):
-        def visit_transform(self, transform_node):
-          from apache_beam.testing.test_stream import TestStream
-          if (isinstance(transform_node.transform, TestStream) and
-              not transform_node.transform._events):
-            transform_node.transform._endpoint = endpoint
-
-      pipeline_to_execute.visit(TestStreamVisitor())
-
-    if not self._skip_display:
+      # Walk the applied transforms directly instead of paying the
+      # per-node method dispatch of a PipelineVisitor; only TestStream
+      # transforms (usually 0 or 1) need their endpoints patched.
+      from apache_beam.testing.test_stream import TestStream
+      stack = [pipeline_to_execute.transforms_stack[0]]
+      while stack:
+        transform_node = stack.pop()
+        if (isinstance(transform_node.transform, TestStream) and
+            not transform_node.transform._events):
+          transform_node.transform._endpoint = endpoint
+        stack.extend(transform_node.parts)
+
+    if self.is_display_enabled:
+      from apache_beam.runners.interactive.display import pipeline_graph
       a_pipeline_graph = pipeline_graph.PipelineGraph(
           pipeline_instrument.original_pipeline_proto,
           render_option=self._render_option)
@@ -209,15 +323,21 @@ class InteractiveRunner(runners.PipelineRunner):
     # outer scopes are also recommended since the user_pipeline might not be
     # available from within this scope.
     if user_pipeline:
-      ie.current_env().set_pipeline_result(user_pipeline, main_job_result)
+      env.set_pipeline_result(user_pipeline, main_job_result)
 
     if self._blocking:
       main_job_result.wait_until_finish()
 
     if main_job_result.state is beam.runners.runner.PipelineState.DONE:
       # pylint: disable=bad-option-value
-      ie.current_env().mark_pcollection_computed(
-          pipeline_instrument.cached_pcolls)
+      # Only pass along the delta; anything already marked computed would
+      # just be re-added to the environment's set. Diffing against the
+      # environment (rather than runner-side bookkeeping) stays correct
+      # across evictions.
+      newly_computed = (
+          pipeline_instrument.cached_pcolls - env.computed_pcollections)
+      if newly_computed:
+        env.mark_pcollection_computed(newly_computed)
 
     return main_job_result
 
@@ -231,17 +351,20 @@ class InteractiveRunner(runners.PipelineRunner):
     pipeline options.
     """
     clusters = ie.current_env().clusters
-    if clusters.pipelines.get(user_pipeline, None):
+    if user_pipeline in clusters.pipelines:
       # Noop for a known pipeline using a known Dataproc cluster.
       return
     flink_master = self._strip_protocol_if_any(
         options.view_as(FlinkRunnerOptions).flink_master)
-    cluster_metadata = clusters.default_cluster_metadata
+    if flink_master != '[auto]' and flink_master not in clusters.master_urls:
+      # Noop if a self-hosted Flink is in use.
+      return
     if flink_master == '[auto]':
       # Try to create/reuse a cluster when no flink_master is given.
+      cluster_metadata = clusters.default_cluster_metadata
       project_id = options.view_as(GoogleCloudOptions).project
-      region = options.view_as(GoogleCloudOptions).region or 'us-central1'
       if project_id:
+        region = options.view_as(GoogleCloudOptions).region or 'us-central1'
         if clusters.default_cluster_metadata:
           # Reuse the cluster name from default in case of a known cluster.
           cluster_metadata = ClusterMetadata(
@@ -255,10 +378,8 @@ class InteractiveRunner(runners.PipelineRunner):
         # Add additional configurations.
         self._worker_options_to_cluster_metadata(options, cluster_metadata)
       # else use the default cluster metadata.
-    elif flink_master in clusters.master_urls:
+    else:
       cluster_metadata = clusters.cluster_metadata(flink_master)
-    else:  # Noop if a self-hosted Flink is in use.
-      return
     if not cluster_metadata:
       return  # Not even a default cluster to create/reuse, run Flink locally.
     dcm = clusters.create(cluster_metadata)
@@ -271,11 +392,7 @@ class InteractiveRunner(runners.PipelineRunner):
         dcm.cluster_metadata.master_url)
 
   def _strip_protocol_if_any(self, flink_master: Optional[str]):
-    if flink_master:
-      parts = flink_master.split('://')
-      if len(parts) > 1:
-        return parts[1]
-    return flink_master
+    return _strip_protocol_if_any(flink_master)
 
   def _worker_options_to_cluster_metadata(
       self, options: PipelineOptions, cluster_metadata: ClusterMetadata):
@@ -299,6 +416,9 @@ class InteractiveRunner(runners.PipelineRunner):
 
 class PipelineResult(beam.runners.runner.PipelineResult):
   """Provides access to information about a pipeline."""
+
+  __slots__ = ('_underlying_result', '_pipeline_instrument', '_terminal_state')
+
   def __init__(self, underlying_result, pipeline_instrument):
     """Constructor of PipelineResult.
 
@@ -312,10 +432,18 @@ class PipelineResult(beam.runners.runner.PipelineResult):
     super().__init__(underlying_result.state)
     self._underlying_result = underlying_result
     self._pipeline_instrument = pipeline_instrument
+    self._terminal_state = None
 
   @property
   def state(self):
-    return self._underlying_result.state
+    # Once a pipeline reaches a terminal state it never leaves it, so avoid
+    # querying the underlying result (possibly an RPC) again.
+    if self._terminal_state is None:
+      state = self._underlying_result.state
+      if beam.runners.runner.PipelineState.is_terminal(state):
+        self._terminal_state = state
+      return state
+    return self._terminal_state
 
   def wait_until_finish(self):
     self._underlying_result.wait_until_finish()
@@ -331,18 +459,20 @@ class PipelineResult(beam.runners.runner.PipelineResult):
   def read(self, pcoll, include_window_info=False):
     """Reads the PCollection one element at a time from cache.
 
+    Returns a lazy generator; prefer this over get() when the full
+    materialized list is not needed.
+
     If include_window_info is True, then returns the elements as
     WindowedValues. Otherwise, return the element as itself.
     """
     key = self._pipeline_instrument.cache_key(pcoll)
     cache_manager = ie.current_env().get_cache_manager(
         self._pipeline_instrument.user_pipeline)
-    if key and cache_manager.exists('full', key):
-      coder = cache_manager.load_pcoder('full', key)
-      reader, _ = cache_manager.read('full', key)
-      return to_element_list(reader, coder, include_window_info)
-    else:
+    reader_and_coder = cache_manager.open_reader('full', key) if key else None
+    if reader_and_coder is None:
       raise ValueError('PCollection not available, please run the pipeline.')
+    reader, coder = reader_and_coder
+    return to_element_list(reader, coder, include_window_info)
 
   def cancel(self):
     self._underlying_result.cancel()
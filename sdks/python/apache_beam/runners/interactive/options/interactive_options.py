@@ -35,6 +35,16 @@ class InteractiveOptions(object):
     self._display_timestamp_format = '%Y-%m-%d %H:%M:%S.%f%z'
     self._display_timezone = tz.tzlocal()
     self._cache_root = None
+    self._version = 0
+
+  @property
+  def version(self):
+    """A monotonic counter bumped whenever an option value is mutated.
+
+    Callers that derive state from option values can compare this against
+    a remembered version instead of re-reading the options on hot paths.
+    """
+    return self._version
 
   def __repr__(self):
     options_str = '\n'.join(
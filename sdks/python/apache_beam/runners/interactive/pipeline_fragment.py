@@ -96,12 +96,21 @@ class PipelineFragment(object):
   def deduce_fragment(self):
     """Deduce the pipeline fragment as an apache_beam.Pipeline instance."""
     fragment = beam.pipeline.Pipeline.from_runner_api(
-        self._runner_pipeline.to_runner_api(),
+        self.deduce_fragment_proto(),
         self._runner_pipeline.runner,
         self._options)
     ie.current_env().add_derived_pipeline(self._runner_pipeline, fragment)
     return fragment
 
+  def deduce_fragment_proto(self):
+    """Deduce the pipeline fragment as a runner API proto.
+
+    Callers that only need the portable proto should prefer this over
+    deduce_fragment().to_runner_api(), which pays an extra proto ->
+    Pipeline -> proto round trip to build an intermediate copy.
+    """
+    return self._runner_pipeline.to_runner_api()
+
   def run(self, display_pipeline_graph=False, use_cache=True, blocking=False):
     """Shorthand to run the pipeline fragment."""
     from apache_beam.runners.interactive.interactive_runner import InteractiveRunner
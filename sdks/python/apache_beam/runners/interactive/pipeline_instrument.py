@@ -68,15 +68,17 @@ class PipelineInstrument(object):
       self._cache_manager = ie.current_env().get_cache_manager(
           self._user_pipeline)
 
+    # Snapshot of original pipeline information. The same proto also seeds the
+    # background caching pipeline below so that the pipeline is only translated
+    # to a runner API proto once.
+    (self._original_pipeline_proto,
+     context) = self._pipeline.to_runner_api(return_context=True)
+
     self._background_caching_pipeline = beam.pipeline.Pipeline.from_runner_api(
-        pipeline.to_runner_api(), pipeline.runner, options)
+        self._original_pipeline_proto, pipeline.runner, options)
     ie.current_env().add_derived_pipeline(
         self._pipeline, self._background_caching_pipeline)
 
-    # Snapshot of original pipeline information.
-    (self._original_pipeline_proto,
-     context) = self._pipeline.to_runner_api(return_context=True)
-
     # All compute-once-against-original-pipeline fields.
     self._unbounded_sources = utils.unbounded_sources(
         self._background_caching_pipeline)
@@ -119,8 +121,7 @@ class PipelineInstrument(object):
     if len(targets) > 0:
       # Prunes upstream transforms that don't contribute to the targets the
       # instrumented pipeline run cares.
-      return pf.PipelineFragment(
-          list(targets)).deduce_fragment().to_runner_api()
+      return pf.PipelineFragment(list(targets)).deduce_fragment_proto()
     return self._pipeline.to_runner_api()
 
   def _required_components(
@@ -88,11 +88,17 @@ def to_element_list(
       else:
         yield e
 
+  if not n:
+    # Unlimited reads can stream straight through without the per-element
+    # count bookkeeping below.
+    yield from elements()
+    return
+
   # Because we can yield multiple elements from a single TestStreamFileRecord,
   # we have to limit the count here to ensure that `n` is fulfilled.
   count = 0
   for e in elements():
-    if n and count >= n:
+    if count >= n:
       break
 
     yield e
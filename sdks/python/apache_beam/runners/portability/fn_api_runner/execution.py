@@ -20,12 +20,13 @@
 # mypy: disallow-untyped-defs
 
 import collections
-import copy
+import concurrent.futures
+import functools
 import itertools
 import logging
 import struct
+import threading
 import typing
-import uuid
 import weakref
 from typing import TYPE_CHECKING
 from typing import Any
@@ -90,8 +91,76 @@ if TYPE_CHECKING:
 
 _LOGGER = logging.getLogger(__name__)
 
-SAFE_WINDOW_FNS = set(
-    window.WindowFn._known_urns.keys()) - {python_urns.PICKLED_WINDOWFN}
+# Pre-compiled so the format string is parsed once, not per packed value.
+_INT32_BIG_ENDIAN_PACK = struct.Struct('>i').pack
+
+
+def _joined_keys_chunk(keys):
+  # type: (List[bytes]) -> List[bytes]
+
+  """Deferred-state factory for a window's multimap keys view."""
+  return [b''.join(keys)]
+
+
+def _joined_kv_chunks(kv_chunks):
+  # type: (List[Tuple[bytes, bytes, bytes]]) -> List[bytes]
+
+  """Deferred-state factory for a window's KV<K, Iterable<V>> view."""
+  return [b''.join(chunk) for chunk in kv_chunks]
+
+
+# Transforms whose payload is a CombinePayload and hence references an
+# accumulator coder.
+_COMBINE_PAYLOAD_URNS = frozenset([
+    common_urns.composites.COMBINE_PER_KEY.urn,
+    common_urns.combine_components.COMBINE_PER_KEY_PRECOMBINE.urn,
+    common_urns.combine_components.COMBINE_PER_KEY_MERGE_ACCUMULATORS.urn,
+    common_urns.combine_components.COMBINE_PER_KEY_EXTRACT_OUTPUTS.urn,
+    common_urns.combine_components.COMBINE_PER_KEY_CONVERT_TO_ACCUMULATORS.urn,
+    common_urns.combine_components.COMBINE_GROUPED_VALUES.urn,
+])
+
+# Number of elements encoded per state append when writing iterable state.
+# Bounds peak memory for very large iterables and keeps each write well clear
+# of protobuf's 2GB message limit.
+_ITERABLE_STATE_WRITE_CHUNK_SIZE = 10000
+
+# Template for wrapping trivially-windowed groups on emit. The window,
+# timestamp and pane metadata are identical for every group, so emitters only
+# pay for a with_value() call instead of rebuilding this scaffolding.
+_GLOBAL_WINDOWED_VALUE_TEMPLATE = GlobalWindows.windowed_value(
+    None,
+    timestamp=GlobalWindow().max_timestamp(),
+    pane_info=windowed_value.PaneInfo(
+        is_first=True,
+        is_last=True,
+        timing=windowed_value.PaneInfoTiming.ON_TIME,
+        index=0,
+        nonspeculative_index=0))
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_pardo_payload(payload_bytes):
+  # type: (bytes) -> beam_runner_api_pb2.ParDoPayload
+  """Returns the parsed ParDoPayload for the given serialized bytes.
+
+  The setup passes (initial-input enqueueing, side-input indexing, timer
+  coder mapping) all inspect the same transforms; payload bytes never change
+  after translation, so the parse is shared. Callers must treat the returned
+  proto as read-only.
+  """
+  return proto_utils.parse_Bytes(
+      payload_bytes, beam_runner_api_pb2.ParDoPayload)
+
+
+@functools.lru_cache(maxsize=None)
+def _safe_window_fns():
+  # type: () -> frozenset
+  # Computed lazily rather than at import so that window fn urns registered
+  # after this module is imported are still observed; _known_urns is a live
+  # dict that registration decorators keep appending to.
+  return frozenset(
+      window.WindowFn._known_urns.keys()) - {python_urns.PICKLED_WINDOWFN}
 
 
 class Buffer(Protocol):
@@ -131,6 +200,8 @@ class PartitionableBuffer(Buffer, Protocol):
 
 class ListBuffer:
   """Used to support parititioning of a list."""
+  __slots__ = ('_coder_impl', '_inputs', '_grouped_output', 'cleared')
+
   def __init__(self, coder_impl):
     # type: (Optional[CoderImpl]) -> None
     self._coder_impl = coder_impl or CoderImpl()
@@ -140,7 +211,8 @@ class ListBuffer:
 
   def copy(self) -> 'ListBuffer':
     new = ListBuffer(self._coder_impl)
-    new._inputs = [v for v in self._inputs]
+    # The elements are immutable bytes, so a shallow list copy suffices.
+    new._inputs = self._inputs.copy()
     return new
 
   def extend(self, extra: 'Buffer') -> None:
@@ -167,18 +239,21 @@ class ListBuffer:
       return [self._inputs[k::n] for k in range(n)]
     else:
       if not self._grouped_output:
-        output_stream_list = [create_OutputStream() for _ in range(n)]
-        idx = 0
+        # Decoding is only used to find element boundaries; the raw bytes
+        # of each element are sliced out and redistributed as-is instead
+        # of being re-encoded through an output stream.
+        output_chunks = [[] for _ in range(n)]  # type: List[List[bytes]]
+        chunk_cycle = itertools.cycle(output_chunks)
         for input in self._inputs:
           input_stream = create_InputStream(input)
+          total = len(input)
+          start = 0
           while input_stream.size() > 0:
-            decoded_value = self._coder_impl.decode_from_stream(
-                input_stream, True)
-            self._coder_impl.encode_to_stream(
-                decoded_value, output_stream_list[idx], True)
-            idx = (idx + 1) % n
-        self._grouped_output = [[output_stream.get()]
-                                for output_stream in output_stream_list]
+            self._coder_impl.decode_from_stream(input_stream, True)
+            end = total - input_stream.size()
+            next(chunk_cycle).append(input[start:end])
+            start = end
+        self._grouped_output = [[b''.join(chunks)] for chunks in output_chunks]
       return self._grouped_output
 
   def __iter__(self):
@@ -204,6 +279,18 @@ class ListBuffer:
 
 class GroupingBuffer(object):
   """Used to accumulate groupded (shuffled) results."""
+  __slots__ = (
+      '_key_coder',
+      '_pre_grouped_coder',
+      '_post_grouped_coder',
+      '_pre_grouped_coder_impl',
+      '_post_grouped_coder_impl',
+      '_key_coder_impl',
+      '_table',
+      '_windowing',
+      '_is_trivial_windowing',
+      '_grouped_output')
+
   def __init__(self,
                pre_grouped_coder,  # type: coders.Coder
                post_grouped_coder,  # type: coders.Coder
@@ -213,9 +300,17 @@ class GroupingBuffer(object):
     self._key_coder = pre_grouped_coder.key_coder()
     self._pre_grouped_coder = pre_grouped_coder
     self._post_grouped_coder = post_grouped_coder
+    # Cache coder impls and windowing triviality up front so the per-element
+    # paths below don't re-derive them on every append/partition call.
+    self._pre_grouped_coder_impl = pre_grouped_coder.get_impl()
+    self._post_grouped_coder_impl = post_grouped_coder.get_impl()
+    self._key_coder_impl = self._key_coder.get_impl()
+    # Keyed by the encoded key bytes; partition() decodes them on emit, so
+    # the table must keep the exact encoded form rather than a digest of it.
     self._table = collections.defaultdict(
         list)  # type: DefaultDict[bytes, List[Any]]
     self._windowing = windowing
+    self._is_trivial_windowing = windowing.is_default()
     self._grouped_output = None  # type: Optional[List[List[bytes]]]
 
   def copy(self) -> 'GroupingBuffer':
@@ -229,17 +324,37 @@ class GroupingBuffer(object):
     if self._grouped_output:
       raise RuntimeError('Grouping table append after read.')
     input_stream = create_InputStream(elements_data)
-    coder_impl = self._pre_grouped_coder.get_impl()
-    key_coder_impl = self._key_coder.get_impl()
     # TODO(robertwb): We could optimize this even more by using a
     # window-dropping coder for the data plane.
-    is_trivial_windowing = self._windowing.is_default()
-    while input_stream.size() > 0:
-      windowed_key_value = coder_impl.decode_from_stream(input_stream, True)
-      key, value = windowed_key_value.value
-      self._table[key_coder_impl.encode(key)].append(
-          value if is_trivial_windowing else windowed_key_value.
-          with_value(value))
+    # The loop is split by windowing triviality and works on locals so the
+    # per-element cost is just decode, key encode and one dict operation.
+    table = self._table
+    decode_from_stream = self._pre_grouped_coder_impl.decode_from_stream
+    encode = self._key_coder_impl.encode
+    size = input_stream.size
+    # Bundles frequently carry runs of identical keys, so remember the last
+    # key's group to skip the dict lookup (and its key-bytes hashing) for
+    # consecutive elements of the same key.
+    last_key = None  # type: Optional[bytes]
+    group = []  # type: List[Any]
+    if self._is_trivial_windowing:
+      while size() > 0:
+        windowed_key_value = decode_from_stream(input_stream, True)
+        key, value = windowed_key_value.value
+        encoded_key = encode(key)
+        if encoded_key != last_key:
+          last_key = encoded_key
+          group = table[encoded_key]
+        group.append(value)
+    else:
+      while size() > 0:
+        windowed_key_value = decode_from_stream(input_stream, True)
+        key, value = windowed_key_value.value
+        encoded_key = encode(key)
+        if encoded_key != last_key:
+          last_key = encoded_key
+          group = table[encoded_key]
+        group.append(windowed_key_value.with_value(value))
 
   def extend(self, input_buffer):
     # type: (Buffer) -> None
@@ -260,18 +375,29 @@ class GroupingBuffer(object):
     is not supported now.
     """
     if not self._grouped_output:
-      if self._windowing.is_default():
-        globally_window = GlobalWindows.windowed_value(
-            None,
-            timestamp=GlobalWindow().max_timestamp(),
-            pane_info=windowed_value.PaneInfo(
-                is_first=True,
-                is_last=True,
-                timing=windowed_value.PaneInfoTiming.ON_TIME,
-                index=0,
-                nonspeculative_index=0)).with_value
-        windowed_key_values = lambda key, values: [
-            globally_window((key, values))]
+      if not self._table:
+        # Nothing was grouped; don't allocate n output streams just to
+        # produce empty chunks.
+        self._grouped_output = [[] for _ in range(n)]
+        return self._grouped_output
+      coder_impl = self._post_grouped_coder_impl
+      key_coder_impl = self._key_coder_impl
+      self._grouped_output = [[] for _ in range(n)]
+      output_stream_list = [create_OutputStream() for _ in range(n)]
+      stream_cycle = itertools.cycle(output_stream_list)
+      if self._is_trivial_windowing:
+        # Trivial windowing always emits exactly one windowed value per key,
+        # so decode, wrap and encode are fused into a single call per group
+        # on the shared template rather than detouring through a closure
+        # that materializes an intermediate list.
+        globally_window = _GLOBAL_WINDOWED_VALUE_TEMPLATE.with_value
+        encode_to_stream = coder_impl.encode_to_stream
+        decode = key_coder_impl.decode
+        for encoded_key, windowed_values in self._table.items():
+          encode_to_stream(
+              globally_window((decode(encoded_key), windowed_values)),
+              next(stream_cycle),
+              True)
       else:
         # TODO(pabloem, BEAM-7514): Trigger driver needs access to the clock
         #   note that this only comes through if windowing is default - but what
@@ -279,14 +405,11 @@ class GroupingBuffer(object):
         #   May need to revise.
         trigger_driver = trigger.create_trigger_driver(self._windowing, True)
         windowed_key_values = trigger_driver.process_entire_key
-      coder_impl = self._post_grouped_coder.get_impl()
-      key_coder_impl = self._key_coder.get_impl()
-      self._grouped_output = [[] for _ in range(n)]
-      output_stream_list = [create_OutputStream() for _ in range(n)]
-      for idx, (encoded_key, windowed_values) in enumerate(self._table.items()):
-        key = key_coder_impl.decode(encoded_key)
-        for wkvs in windowed_key_values(key, windowed_values):
-          coder_impl.encode_to_stream(wkvs, output_stream_list[idx % n], True)
+        for encoded_key, windowed_values in self._table.items():
+          key = key_coder_impl.decode(encoded_key)
+          output_stream = next(stream_cycle)
+          for wkvs in windowed_key_values(key, windowed_values):
+            coder_impl.encode_to_stream(wkvs, output_stream, True)
       for ix, output_stream in enumerate(output_stream_list):
         self._grouped_output[ix] = [output_stream.get()]
       self._table.clear()
@@ -316,6 +439,17 @@ class GroupingBuffer(object):
 
 class WindowGroupingBuffer(object):
   """Used to partition windowed side inputs."""
+  __slots__ = (
+      '_kv_extractor',
+      '_key_coder',
+      '_value_coder',
+      '_windowed_value_coder',
+      '_window_coder',
+      '_windowed_value_coder_impl',
+      '_key_coder_impl',
+      '_value_coder_impl',
+      '_values_by_window')
+
   def __init__(
       self,
       access_pattern,  # type: beam_runner_api_pb2.FunctionSpec
@@ -336,25 +470,37 @@ class WindowGroupingBuffer(object):
       raise ValueError("Unknown access pattern: '%s'" % access_pattern.urn)
     self._windowed_value_coder = coder
     self._window_coder = coder.window_coder
+    # Cache coder impls once; append and encoded_items are called per
+    # element batch and should not pay get_impl() each time.
+    self._windowed_value_coder_impl = coder.get_impl(
+    )  # type: WindowedValueCoderImpl
+    self._key_coder_impl = self._key_coder.get_impl()
+    self._value_coder_impl = self._value_coder.get_impl()
     self._values_by_window = collections.defaultdict(
         list)  # type: DefaultDict[Tuple[str, BoundedWindow], List[Any]]
 
   def append(self, elements_data):
     # type: (bytes) -> None
-    input_stream = create_InputStream(elements_data)
-    while input_stream.size() > 0:
-      windowed_val_coder_impl = self._windowed_value_coder.get_impl(
-      )  # type: WindowedValueCoderImpl
-      windowed_value = windowed_val_coder_impl.decode_from_stream(
-          input_stream, True)
-      key, value = self._kv_extractor(windowed_value.value)
-      for window in windowed_value.windows:
-        self._values_by_window[key, window].append(value)
+    self.extend((elements_data, ))
+
+  def extend(self, raw_items):
+    # type: (Iterable[bytes]) -> None
+    windowed_val_coder_impl = self._windowed_value_coder_impl
+    kv_extractor = self._kv_extractor
+    values_by_window = self._values_by_window
+    for elements_data in raw_items:
+      input_stream = create_InputStream(elements_data)
+      while input_stream.size() > 0:
+        windowed_value = windowed_val_coder_impl.decode_from_stream(
+            input_stream, True)
+        key, value = kv_extractor(windowed_value.value)
+        for window in windowed_value.windows:
+          values_by_window[key, window].append(value)
 
   def encoded_items(self):
     # type: () -> Iterator[Tuple[bytes, bytes, bytes, int]]
-    value_coder_impl = self._value_coder.get_impl()
-    key_coder_impl = self._key_coder.get_impl()
+    value_coder_impl = self._value_coder_impl
+    key_coder_impl = self._key_coder_impl
     for (key, window), values in self._values_by_window.items():
       encoded_window = self._window_coder.encode(window)
       encoded_key = key_coder_impl.encode_nested(key)
@@ -411,41 +557,48 @@ class _ProcessingQueueManager(object):
        and inputs are dictionaries mapping PCollection name to data buffers.
   """
   class KeyedQueue(Generic[QUEUE_KEY_TYPE]):
+    __slots__ = ('_q', )
+
     def __init__(self) -> None:
-      self._q: typing.Deque[Tuple[QUEUE_KEY_TYPE,
-                                  DataInput]] = collections.deque()
-      self._keyed_elements: MutableMapping[QUEUE_KEY_TYPE,
-                                           Tuple[QUEUE_KEY_TYPE,
-                                                 DataInput]] = {}
+      # A single insertion-ordered map doubles as the FIFO queue and the
+      # key-to-element index that enque uses to merge duplicate keys.
+      self._q: typing.OrderedDict[QUEUE_KEY_TYPE,
+                                  Tuple[QUEUE_KEY_TYPE,
+                                        DataInput]] = collections.OrderedDict()
 
     def enque(self, elm: Tuple[QUEUE_KEY_TYPE, DataInput]) -> None:
       key = elm[0]
       incoming_inputs: DataInput = elm[1]
       if not incoming_inputs:
         return
-      if key in self._keyed_elements:
-        existing_inputs = self._keyed_elements[key][1]
-        for pcoll in incoming_inputs.data:
-          if incoming_inputs.data[pcoll] and existing_inputs.data.get(pcoll):
-            existing_inputs.data[pcoll].extend(incoming_inputs.data[pcoll])
-          elif incoming_inputs.data[pcoll]:
-            existing_inputs.data[pcoll] = incoming_inputs.data[pcoll]
-        for timer_family in (incoming_inputs.timers or []):
-          if (incoming_inputs.timers[timer_family] and
-              existing_inputs.timers.get(timer_family)):
-            existing_inputs.timers[timer_family].extend(
-                incoming_inputs.timers[timer_family])
-          elif incoming_inputs.timers[timer_family]:
-            existing_inputs.timers[timer_family] = incoming_inputs.timers[
-                timer_family]
-      else:
-        self._keyed_elements[key] = elm
-        self._q.appendleft(elm)
+      existing_elm = self._q.get(key)
+      if existing_elm is None:
+        self._q[key] = elm
+        return
+      # This is the merge point for every completed bundle, so the loops
+      # below do a single lookup per pcoll/timer family rather than
+      # re-indexing both dicts on each branch.
+      existing_inputs = existing_elm[1]
+      existing_data = existing_inputs.data
+      for pcoll, buffer in incoming_inputs.data.items():
+        if buffer:
+          existing_buffer = existing_data.get(pcoll)
+          if existing_buffer:
+            existing_buffer.extend(buffer)
+          else:
+            existing_data[pcoll] = buffer
+      if incoming_inputs.timers:
+        existing_timers = existing_inputs.timers
+        for timer_family, timers in incoming_inputs.timers.items():
+          if timers:
+            existing_family_timers = existing_timers.get(timer_family)
+            if existing_family_timers:
+              existing_family_timers.extend(timers)
+            else:
+              existing_timers[timer_family] = timers
 
     def deque(self) -> Tuple[QUEUE_KEY_TYPE, DataInput]:
-      elm = self._q.pop()
-      key = elm[0]
-      del self._keyed_elements[key]
+      _, elm = self._q.popitem(last=False)
       return elm
 
     def __len__(self) -> int:
@@ -456,7 +609,7 @@ class _ProcessingQueueManager(object):
 
     def __str__(self) -> str:
       return '<%s len: %s %s>' % (
-          self.__class__.__name__, len(self), list(self._q))
+          self.__class__.__name__, len(self), list(self._q.values()))
 
   def __init__(self) -> None:
     # For time-pending and watermark-pending inputs, the key type is
@@ -479,11 +632,15 @@ class GenericMergingWindowFn(window.WindowFn):
   FROM_SDK_TRANSFORM = 'write'
 
   _HANDLES = {}  # type: Dict[str, GenericMergingWindowFn]
+  _HANDLE_COUNTER = itertools.count()
 
   def __init__(self, execution_context, windowing_strategy_proto):
     # type: (FnApiRunnerExecutionContext, beam_runner_api_pb2.WindowingStrategy) -> None
     self._worker_handler = None  # type: Optional[worker_handlers.WorkerHandler]
-    self._handle_id = handle_id = uuid.uuid4().hex
+    # A process-wide counter is unique within _HANDLES and much cheaper
+    # than drawing OS entropy through uuid4 per windowing strategy.
+    self._handle_id = handle_id = str(next(self._HANDLE_COUNTER))
+    self._handle_payload = handle_id.encode('utf-8')
     self._HANDLES[handle_id] = self
     # ExecutionContexts are expensive, we don't want to keep them in the
     # static dictionary forever.  Instead we hold a weakref and pop self
@@ -506,13 +663,22 @@ class GenericMergingWindowFn(window.WindowFn):
 
   def payload(self):
     # type: () -> bytes
-    return self._handle_id.encode('utf-8')
+    return self._handle_payload
+
+  @staticmethod
+  @functools.lru_cache(maxsize=256)
+  def _decode_handle_id(handle_id):
+    # type: (bytes) -> str
+    # The set of live handle ids is tiny, but this decode runs on every
+    # deserialization of a merge request; cache the string it produces.
+    return handle_id.decode('utf-8')
 
   @staticmethod
   @window.urns.RunnerApiFn.register_urn(URN, bytes)
   def from_runner_api_parameter(handle_id, unused_context):
     # type: (bytes, Any) -> GenericMergingWindowFn
-    return GenericMergingWindowFn._HANDLES[handle_id.decode('utf-8')]
+    return GenericMergingWindowFn._HANDLES[
+        GenericMergingWindowFn._decode_handle_id(handle_id)]
 
   def assign(self, assign_context):
     # type: (window.WindowFn.AssignContext) -> Iterable[window.BoundedWindow]
@@ -587,49 +753,74 @@ class GenericMergingWindowFn(window.WindowFn):
         data_spec.api_service_descriptor.url = (data_api_service_descriptor.url)
       return data_spec.SerializeToString()
 
-    pipeline_context = self._execution_context_ref().pipeline_context
+    execution_context = self._execution_context_ref()
+    pipeline_context = execution_context.pipeline_context
     global_windowing_strategy_id = self.uid('global_windowing_strategy')
     global_windowing_strategy_proto = core.Windowing(
         window.GlobalWindows()).to_runner_api(pipeline_context)
-    coders = dict(pipeline_context.coders.get_id_to_proto_map())
-
-    def make_coder(urn, *components):
-      # type: (str, str) -> str
-      coder_proto = beam_runner_api_pb2.Coder(
-          spec=beam_runner_api_pb2.FunctionSpec(urn=urn),
-          component_coder_ids=components)
-      coder_id = self.uid('coder')
-      coders[coder_id] = coder_proto
-      pipeline_context.coders.put_proto(coder_id, coder_proto)
-      return coder_id
-
-    bytes_coder_id = make_coder(common_urns.coders.BYTES.urn)
+
     window_coder_id = self._windowing_strategy_proto.window_coder_id
-    global_window_coder_id = make_coder(common_urns.coders.GLOBAL_WINDOW.urn)
-    iter_window_coder_id = make_coder(
-        common_urns.coders.ITERABLE.urn, window_coder_id)
-    input_coder_id = make_coder(
-        common_urns.coders.KV.urn, bytes_coder_id, iter_window_coder_id)
-    output_coder_id = make_coder(
-        common_urns.coders.KV.urn,
-        bytes_coder_id,
-        make_coder(
-            common_urns.coders.KV.urn,
-            iter_window_coder_id,
-            make_coder(
-                common_urns.coders.ITERABLE.urn,
-                make_coder(
-                    common_urns.coders.KV.urn,
-                    window_coder_id,
-                    iter_window_coder_id))))
-    windowed_input_coder_id = make_coder(
-        common_urns.coders.WINDOWED_VALUE.urn,
-        input_coder_id,
-        global_window_coder_id)
-    windowed_output_coder_id = make_coder(
-        common_urns.coders.WINDOWED_VALUE.urn,
-        output_coder_id,
-        global_window_coder_id)
+    coder_graph_key = (
+        window_coder_id, self._windowing_strategy_proto.environment_id)
+    cached_coder_ids = execution_context.merge_window_coder_ids.get(
+        coder_graph_key)
+    if cached_coder_ids:
+      # An identical strategy already registered the coder graph with this
+      # pipeline context; only the (cheap) descriptor itself differs per
+      # instance.
+      (input_coder_id,
+       output_coder_id,
+       windowed_input_coder_id,
+       windowed_output_coder_id) = cached_coder_ids
+    else:
+      pending_coders = {}  # type: Dict[str, beam_runner_api_pb2.Coder]
+
+      def make_coder(urn, *components):
+        # type: (str, str) -> str
+        coder_proto = beam_runner_api_pb2.Coder(
+            spec=beam_runner_api_pb2.FunctionSpec(urn=urn),
+            component_coder_ids=components)
+        coder_id = self.uid('coder')
+        pending_coders[coder_id] = coder_proto
+        return coder_id
+
+      bytes_coder_id = make_coder(common_urns.coders.BYTES.urn)
+      global_window_coder_id = make_coder(common_urns.coders.GLOBAL_WINDOW.urn)
+      iter_window_coder_id = make_coder(
+          common_urns.coders.ITERABLE.urn, window_coder_id)
+      input_coder_id = make_coder(
+          common_urns.coders.KV.urn, bytes_coder_id, iter_window_coder_id)
+      output_coder_id = make_coder(
+          common_urns.coders.KV.urn,
+          bytes_coder_id,
+          make_coder(
+              common_urns.coders.KV.urn,
+              iter_window_coder_id,
+              make_coder(
+                  common_urns.coders.ITERABLE.urn,
+                  make_coder(
+                      common_urns.coders.KV.urn,
+                      window_coder_id,
+                      iter_window_coder_id))))
+      windowed_input_coder_id = make_coder(
+          common_urns.coders.WINDOWED_VALUE.urn,
+          input_coder_id,
+          global_window_coder_id)
+      windowed_output_coder_id = make_coder(
+          common_urns.coders.WINDOWED_VALUE.urn,
+          output_coder_id,
+          global_window_coder_id)
+      for coder_id, coder_proto in pending_coders.items():
+        pipeline_context.coders.put_proto(coder_id, coder_proto)
+      execution_context.merge_window_coder_ids[coder_graph_key] = (
+          input_coder_id,
+          output_coder_id,
+          windowed_input_coder_id,
+          windowed_output_coder_id)
+
+    # The descriptor constructor copies this map into its proto field, so
+    # hand it the live map instead of paying for an intermediate dict copy.
+    coders = pipeline_context.coders.get_id_to_proto_map()
 
     self.windowed_input_coder_impl = pipeline_context.coders[
         windowed_input_coder_id].get_impl()
@@ -744,55 +935,62 @@ class FnApiRunnerExecutionContext(object):
     self.pipeline_context = pipeline_context.PipelineContext(
         self.pipeline_components,
         iterable_state_write=self._iterable_state_write)
-    self._last_uid = -1
+    # Memoizes the merge-bundle coder graphs built by
+    # GenericMergingWindowFn.make_process_bundle_descriptor, keyed by
+    # (window_coder_id, environment_id). The registered coder IDs are only
+    # meaningful within this context's pipeline_context, so the cache lives
+    # here rather than on the window fn class.
+    self.merge_window_coder_ids = (
+        {})  # type: Dict[Tuple[str, str], Tuple[str, str, str, str]]
+    self._uid_counter = itertools.count()
     self.safe_windowing_strategies = {
         id: self._make_safe_windowing_strategy(id)
         for id in self.pipeline_components.windowing_strategies.keys()
     }
 
     self._stage_managers: Dict[str, BundleContextManager] = {}
+    self._stage_managers_lock = threading.Lock()
+    self._impulse_buffers = {}  # type: Dict[str, ListBuffer]
 
   def bundle_manager_for(
       self,
       stage: Stage,
       num_workers: Optional[int] = None) -> 'BundleContextManager':
-    if stage.name not in self._stage_managers:
-      self._stage_managers[stage.name] = BundleContextManager(
-          self,
-          stage,
-          num_workers or self.num_workers,
-          split_managers=self.split_managers)
-    return self._stage_managers[stage.name]
+    with self._stage_managers_lock:
+      if stage.name not in self._stage_managers:
+        self._stage_managers[stage.name] = BundleContextManager(
+            self,
+            stage,
+            num_workers or self.num_workers,
+            split_managers=self.split_managers)
+      return self._stage_managers[stage.name]
 
   def _compute_pipeline_dictionaries(self) -> None:
+    # Note: proto string fields (urns, transform names) are not interned
+    # here; with the upb protobuf backend every field access returns a fresh
+    # str, so sys.intern on read-back has no lasting effect. Hot paths
+    # instead read each field once into a local (see transforms_by_urn).
     for s in self.stages.values():
-      for t in s.transforms:
+      stage_transforms_by_urn = s.transforms_by_urn
+      for t in stage_transforms_by_urn[bundle_processor.DATA_INPUT_URN]:
         buffer_id = t.spec.payload
-        if t.spec.urn == bundle_processor.DATA_INPUT_URN:
-          self.input_transform_to_buffer_id[t.unique_name] = buffer_id
-          if t.spec.payload == translations.IMPULSE_BUFFER:
-            # Impulse data is not produced by any PTransform.
-            self.pcollection_to_producer_transform[
-                translations.IMPULSE_BUFFER] = None
-          else:
-            assert t.spec.payload != translations.IMPULSE_BUFFER
-            _, input_pcoll = split_buffer_id(buffer_id)
-            # Adding PCollections that may not have a producer.
-            # This is necessary, for example, for the case where we pass an
-            # empty list of PCollections into a Flatten transform.
-            if input_pcoll not in self.pcollection_to_producer_transform:
-              self.pcollection_to_producer_transform[input_pcoll] = None
-            if buffer_id not in self.buffer_id_to_consumer_pairs:
-              self.buffer_id_to_consumer_pairs[buffer_id] = set()
-            if (s.name, t.unique_name
-                ) not in self.buffer_id_to_consumer_pairs[buffer_id]:
-              self.buffer_id_to_consumer_pairs[buffer_id].add(
-                  (s.name, t.unique_name))
-        elif t.spec.urn == bundle_processor.DATA_OUTPUT_URN:
-          _, output_pcoll = split_buffer_id(buffer_id)
-          self.pcollection_to_producer_transform[output_pcoll] = t.unique_name
-        elif t.spec.urn in translations.PAR_DO_URNS:
-          pass
+        self.input_transform_to_buffer_id[t.unique_name] = buffer_id
+        if t.spec.payload == translations.IMPULSE_BUFFER:
+          # Impulse data is not produced by any PTransform.
+          self.pcollection_to_producer_transform[
+              translations.IMPULSE_BUFFER] = None
+        else:
+          assert t.spec.payload != translations.IMPULSE_BUFFER
+          _, input_pcoll = split_buffer_id(buffer_id)
+          # Adding PCollections that may not have a producer.
+          # This is necessary, for example, for the case where we pass an
+          # empty list of PCollections into a Flatten transform.
+          self.pcollection_to_producer_transform.setdefault(input_pcoll, None)
+          self.buffer_id_to_consumer_pairs.setdefault(buffer_id, set()).add(
+              (s.name, t.unique_name))
+      for t in stage_transforms_by_urn[bundle_processor.DATA_OUTPUT_URN]:
+        _, output_pcoll = split_buffer_id(t.spec.payload)
+        self.pcollection_to_producer_transform[output_pcoll] = t.unique_name
 
   def setup(self) -> None:
     """This sets up the pipeline to begin running.
@@ -801,53 +999,100 @@ class FnApiRunnerExecutionContext(object):
     2. It also updates payload fields on DATA_INPUT and DATA_OUTPUT operations
       to the Data API endpoints that are live.
     """
-    for stage in self.stages.values():
-      self._enqueue_stage_initial_inputs(stage)
+    stages = list(self.stages.values())
+    if len(stages) > 1:
+      # Stages are initialized independently; the structures they share
+      # (the uid counter, stage managers, worker handlers and the input
+      # queues) are guarded, so the per-stage proto parsing and worker
+      # acquisition can overlap.
+      with concurrent.futures.ThreadPoolExecutor(
+          max_workers=min(16, len(stages))) as executor:
+        # list() propagates the first exception raised by any stage.
+        list(executor.map(self._enqueue_stage_initial_inputs, stages))
+    else:
+      for stage in stages:
+        self._enqueue_stage_initial_inputs(stage)
+
+  def _impulse_buffer_for(self, coder_id):
+    # type: (str) -> ListBuffer
+
+    """Returns the shared impulse input buffer for the given coder.
+
+    The impulse contents are a fixed constant and initial input buffers are
+    never mutated once enqueued, so all stages can share one buffer per
+    coder. A race between setup threads building the same coder's buffer is
+    benign: each stage just keeps the buffer it built.
+    """
+    buffer = self._impulse_buffers.get(coder_id)
+    if buffer is None:
+      coder = self.pipeline_context.coders[self.safe_coders.get(
+          coder_id, coder_id)]
+      buffer = ListBuffer(coder.get_impl())
+      buffer.append(ENCODED_IMPULSE_VALUE)
+      self._impulse_buffers[coder_id] = buffer
+    return buffer
 
   def _enqueue_stage_initial_inputs(self, stage: Stage) -> None:
     """Sets up IMPULSE inputs for a stage, and the data GRPC API endpoint."""
+    # Eagerly build the stage's bundle context manager so its per-transform
+    # setup cost is paid here (in parallel with the other stages when
+    # setup() uses the thread pool) instead of at first-bundle time.
+    bundle_manager = self.bundle_manager_for(stage)
     data_input = {}  # type: MutableMapping[str, PartitionableBuffer]
-    ready_to_schedule = True
-    for transform in stage.transforms:
-      if (transform.spec.urn in {bundle_processor.DATA_INPUT_URN,
-                                 bundle_processor.DATA_OUTPUT_URN}):
-        if transform.spec.urn == bundle_processor.DATA_INPUT_URN:
-          coder_id = self.data_channel_coders[only_element(
-              transform.outputs.values())]
-          coder = self.pipeline_context.coders[self.safe_coders.get(
-              coder_id, coder_id)]
-          if transform.spec.payload == translations.IMPULSE_BUFFER:
-            data_input[transform.unique_name] = ListBuffer(coder.get_impl())
-            data_input[transform.unique_name].append(ENCODED_IMPULSE_VALUE)
-          else:
-            # If this is not an IMPULSE input, then it is not part of the
-            # initial inputs of a pipeline, and we'll ignore it.
-            pass
-        else:
-          coder_id = self.data_channel_coders[only_element(
-              transform.inputs.values())]
-        # For every DATA_INPUT or DATA_OUTPUT operation, we need to replace the
-        # payload with the GRPC configuration for the Data channel.
-        bundle_manager = self.bundle_manager_for(stage)
+    stage_transforms_by_urn = stage.transforms_by_urn
+    data_input_transforms = stage_transforms_by_urn[
+        bundle_processor.DATA_INPUT_URN]
+    data_output_transforms = stage_transforms_by_urn[
+        bundle_processor.DATA_OUTPUT_URN]
+    if data_input_transforms or data_output_transforms:
+      # The data endpoint is shared by all of this stage's DATA operations;
+      # resolve the service descriptor once.
+      data_api_service_descriptor = bundle_manager.data_api_service_descriptor()
+      data_api_url = (
+          data_api_service_descriptor.url
+          if data_api_service_descriptor else None)
+
+      def replace_payload_with_data_spec(transform, coder_id):
+        # type: (beam_runner_api_pb2.PTransform, str) -> None
+        # For every DATA_INPUT or DATA_OUTPUT operation, we need to replace
+        # the payload with the GRPC configuration for the Data channel.
         data_spec = beam_fn_api_pb2.RemoteGrpcPort(coder_id=coder_id)
-        data_api_service_descriptor = (
-            bundle_manager.data_api_service_descriptor())
-        if data_api_service_descriptor:
-          data_spec.api_service_descriptor.url = (
-              data_api_service_descriptor.url)
+        if data_api_url:
+          data_spec.api_service_descriptor.url = data_api_url
         transform.spec.payload = data_spec.SerializeToString()
-      elif transform.spec.urn in translations.PAR_DO_URNS:
-        payload = proto_utils.parse_Bytes(
-            transform.spec.payload, beam_runner_api_pb2.ParDoPayload)
+
+      for transform in data_input_transforms:
+        coder_id = self.data_channel_coders[only_element(
+            transform.outputs.values())]
+        if transform.spec.payload == translations.IMPULSE_BUFFER:
+          data_input[transform.unique_name] = self._impulse_buffer_for(coder_id)
+        else:
+          # If this is not an IMPULSE input, then it is not part of the
+          # initial inputs of a pipeline, and we'll ignore it.
+          pass
+        replace_payload_with_data_spec(transform, coder_id)
+      for transform in data_output_transforms:
+        replace_payload_with_data_spec(
+            transform,
+            self.data_channel_coders[only_element(transform.inputs.values())])
+    if not data_input:
+      # Only stages with an IMPULSE input have anything to schedule; the
+      # side input scan below matters only for those, so skip it for the
+      # (typically far more numerous) non-root stages.
+      return
+    ready_to_schedule = True
+    for urn in translations.PAR_DO_URNS:
+      for transform in stage_transforms_by_urn[urn]:
+        payload = _parse_pardo_payload(transform.spec.payload)
         if payload.side_inputs:
           # If the stage needs side inputs, then it's not ready to be
           # executed.
           ready_to_schedule = False
-    if data_input and ready_to_schedule:
+    if ready_to_schedule:
       # We push the data inputs, along with the name of the consuming stage.
       _LOGGER.debug('Scheduling bundle in stage for execution: %s', stage.name)
       self.queues.ready_inputs.enque((stage.name, DataInput(data_input, {})))
-    elif data_input and not ready_to_schedule:
+    else:
       _LOGGER.debug(
           'Enqueuing stage pending watermark. Stage name: %s', stage.name)
       self.queues.watermark_pending_inputs.enque(
@@ -863,65 +1108,67 @@ class FnApiRunnerExecutionContext(object):
     patterns for all of the outputs of a stage that will be consumed as a
     side input.
     """
-    transform_consumers = collections.defaultdict(
-        list)  # type: DefaultDict[str, List[beam_runner_api_pb2.PTransform]]
-    stage_consumers = collections.defaultdict(
-        list)  # type: DefaultDict[str, List[translations.Stage]]
-
-    def get_all_side_inputs():
-      # type: () -> Set[str]
-      all_side_inputs = set()  # type: Set[str]
-      for stage in stages:
-        for transform in stage.transforms:
-          for input in transform.inputs.values():
-            transform_consumers[input].append(transform)
-            stage_consumers[input].append(stage)
-        for si in stage.side_inputs():
-          all_side_inputs.add(si)
-      return all_side_inputs
-
-    all_side_inputs = frozenset(get_all_side_inputs())
     data_side_inputs_by_producing_stage = {}  # type: Dict[str, DataSideInput]
-
-    producing_stages_by_pcoll = {}
-
-    for s in stages:
-      data_side_inputs_by_producing_stage[s.name] = {}
-      for transform in s.transforms:
+    # Maps each side-input PCollection directly to its consuming
+    # (transform name, tag, access pattern) triples, so the resolution loop
+    # below is O(#side_inputs) instead of re-scanning every consumer for
+    # every side-input PCollection.
+    side_input_consumers = collections.defaultdict(
+        list
+    )  # type: DefaultDict[str, List[Tuple[str, str, beam_runner_api_pb2.FunctionSpec]]]
+    producing_stages_by_pcoll = {}  # type: Dict[str, translations.Stage]
+
+    for stage in stages:
+      data_side_inputs_by_producing_stage[stage.name] = {}
+      # Each ParDo payload is parsed exactly once here; stage.side_inputs()
+      # would re-parse the payloads on every call.
+      stage_side_inputs = set()  # type: Set[str]
+      for transform in stage.transforms:
+        if transform.spec.urn in translations.PAR_DO_URNS:
+          payload = _parse_pardo_payload(transform.spec.payload)
+          for si_tag, side_input in payload.side_inputs.items():
+            side_pc = transform.inputs[si_tag]
+            stage_side_inputs.add(side_pc)
+            side_input_consumers[side_pc].append(
+                (transform.unique_name, si_tag, side_input.access_pattern))
+      for transform in stage.transforms:
         for o in transform.outputs.values():
-          if o in s.side_inputs():
+          if o in stage_side_inputs:
             continue
           if o in producing_stages_by_pcoll:
             continue
-          producing_stages_by_pcoll[o] = s
-
-    for side_pc in all_side_inputs:
-      for consuming_transform in transform_consumers[side_pc]:
-        if consuming_transform.spec.urn not in translations.PAR_DO_URNS:
-          continue
-        producing_stage = producing_stages_by_pcoll[side_pc]
-        payload = proto_utils.parse_Bytes(
-            consuming_transform.spec.payload, beam_runner_api_pb2.ParDoPayload)
-        for si_tag in payload.side_inputs:
-          if consuming_transform.inputs[si_tag] == side_pc:
-            side_input_id = (consuming_transform.unique_name, si_tag)
-            data_side_inputs_by_producing_stage[
-                producing_stage.name][side_input_id] = (
-                    translations.create_buffer_id(side_pc),
-                    payload.side_inputs[si_tag].access_pattern)
+          producing_stages_by_pcoll[o] = stage
+
+    for side_pc, consumers in side_input_consumers.items():
+      producing_stage = producing_stages_by_pcoll[side_pc]
+      stage_side_input_map = data_side_inputs_by_producing_stage[
+          producing_stage.name]
+      buffer_id = translations.create_buffer_id(side_pc)
+      for transform_name, si_tag, access_pattern in consumers:
+        stage_side_input_map[(transform_name, si_tag)] = (
+            buffer_id, access_pattern)
 
     return data_side_inputs_by_producing_stage
 
   def _make_safe_windowing_strategy(self, id):
     # type: (str) -> str
     windowing_strategy_proto = self.pipeline_components.windowing_strategies[id]
-    if windowing_strategy_proto.window_fn.urn in SAFE_WINDOW_FNS:
+    if windowing_strategy_proto.window_fn.urn in _safe_window_fns():
       return id
     else:
+      windowing_strategies = self.pipeline_components.windowing_strategies
       safe_id = id + '_safe'
-      while safe_id in self.pipeline_components.windowing_strategies:
-        safe_id += '_'
-      safe_proto = copy.copy(windowing_strategy_proto)
+      if safe_id in windowing_strategies:
+        # Disambiguate with a numeric suffix rather than growing the id one
+        # underscore at a time.
+        for counter in itertools.count(1):
+          safe_id = '%s_safe_%d' % (id, counter)
+          if safe_id not in windowing_strategies:
+            break
+      # CopyFrom clones the proto directly; copy.copy() on a message falls
+      # back to __reduce__, paying a serialize/deserialize round trip.
+      safe_proto = beam_runner_api_pb2.WindowingStrategy()
+      safe_proto.CopyFrom(windowing_strategy_proto)
       if (windowing_strategy_proto.merge_status ==
           beam_runner_api_pb2.MergeStatus.NON_MERGING):
         safe_proto.window_fn.urn = GenericNonMergingWindowFn.URN
@@ -947,19 +1194,28 @@ class FnApiRunnerExecutionContext(object):
 
   def next_uid(self):
     # type: () -> str
-    self._last_uid += 1
-    return str(self._last_uid)
+    # next() on an itertools.count is atomic, so no lock is needed even
+    # when stages are set up concurrently.
+    return str(next(self._uid_counter))
 
   def _iterable_state_write(self, values, element_coder_impl):
     # type: (Iterable, CoderImpl) -> bytes
     token = unique_name(None, 'iter').encode('ascii')
-    out = create_OutputStream()
-    for element in values:
-      element_coder_impl.encode_to_stream(element, out, True)
-    self.worker_handler_manager.state_servicer.append_raw(
-        beam_fn_api_pb2.StateKey(
-            runner=beam_fn_api_pb2.StateKey.Runner(key=token)),
-        out.get())
+    state_key = beam_fn_api_pb2.StateKey(
+        runner=beam_fn_api_pb2.StateKey.Runner(key=token))
+    append_raw = self.worker_handler_manager.state_servicer.append_raw
+    encode_all = element_coder_impl.encode_all
+    # Encode in bounded chunks: each chunk is one encode_all call on the
+    # coder impl (a C loop for compiled coders) instead of a Python-level
+    # encode_to_stream call per element, and the iterable never needs to be
+    # materialized in full.
+    values_iter = iter(values)
+    while True:
+      chunk = list(
+          itertools.islice(values_iter, _ITERABLE_STATE_WRITE_CHUNK_SIZE))
+      if not chunk:
+        break
+      append_raw(state_key, encode_all(chunk))
     return token
 
   def commit_side_inputs_to_state(
@@ -976,49 +1232,67 @@ class FnApiRunnerExecutionContext(object):
       if buffer_id not in self.pcoll_buffers:
         self.pcoll_buffers[buffer_id] = ListBuffer(
             coder_impl=value_coder.get_impl())
-      for element_data in self.pcoll_buffers[buffer_id]:
-        elements_by_window.append(element_data)
+      elements_by_window.extend(self.pcoll_buffers[buffer_id])
 
+      # The state keys below are built once per side input and mutated per
+      # (key, window) instead of re-constructing each proto per iteration;
+      # append_raw serializes the key immediately, so the messages can be
+      # safely reused across calls.
+      append_raw = self.state_servicer.append_raw
       if func_spec.urn == common_urns.side_inputs.ITERABLE.urn:
+        state_key = beam_fn_api_pb2.StateKey(
+            iterable_side_input=beam_fn_api_pb2.StateKey.IterableSideInput(
+                transform_id=consuming_transform_id, side_input_id=tag))
+        iterable_side_input = state_key.iterable_side_input
         for _, window, elements_data, _ in elements_by_window.encoded_items():
-          state_key = beam_fn_api_pb2.StateKey(
-              iterable_side_input=beam_fn_api_pb2.StateKey.IterableSideInput(
-                  transform_id=consuming_transform_id,
-                  side_input_id=tag,
-                  window=window))
-          self.state_servicer.append_raw(state_key, elements_data)
+          iterable_side_input.window = window
+          append_raw(state_key, elements_data)
       elif func_spec.urn == common_urns.side_inputs.MULTIMAP.urn:
-        # TODO(robertwb): Consider computing these lazily on demand rather than
-        # anticipating all potentail state requests which will be more cpu and
-        # memory efficient for large side inputs.
+        # Only the plain multimap view is written eagerly; the keys and
+        # KV-iterable views are registered as deferred state below and only
+        # materialized if the SDK actually requests that access pattern.
+        state_key = beam_fn_api_pb2.StateKey(
+            multimap_side_input=beam_fn_api_pb2.StateKey.MultimapSideInput(
+                transform_id=consuming_transform_id, side_input_id=tag))
+        multimap_side_input = state_key.multimap_side_input
+        key_iter_state_key = beam_fn_api_pb2.StateKey(
+            multimap_keys_side_input=beam_fn_api_pb2.StateKey.
+            MultimapKeysSideInput(
+                transform_id=consuming_transform_id, side_input_id=tag))
+        multimap_keys_side_input = key_iter_state_key.multimap_keys_side_input
+        kv_iter_state_key = beam_fn_api_pb2.StateKey(
+            multimap_keys_values_side_input=beam_fn_api_pb2.StateKey.
+            MultimapKeysValuesSideInput(
+                transform_id=consuming_transform_id, side_input_id=tag))
+        multimap_keys_values_side_input = (
+            kv_iter_state_key.multimap_keys_values_side_input)
+        keys_by_window = collections.defaultdict(
+            list)  # type: DefaultDict[bytes, List[bytes]]
+        kv_chunks_by_window = collections.defaultdict(
+            list)  # type: DefaultDict[bytes, List[Tuple[bytes, bytes, bytes]]]
         for (key, window, elements_data,
              elements_count) in elements_by_window.encoded_items():
-          state_key = beam_fn_api_pb2.StateKey(
-              multimap_side_input=beam_fn_api_pb2.StateKey.MultimapSideInput(
-                  transform_id=consuming_transform_id,
-                  side_input_id=tag,
-                  window=window,
-                  key=key))
-          self.state_servicer.append_raw(state_key, elements_data)
-
-          key_iter_state_key = beam_fn_api_pb2.StateKey(
-              multimap_keys_side_input=beam_fn_api_pb2.StateKey.
-              MultimapKeysSideInput(
-                  transform_id=consuming_transform_id,
-                  side_input_id=tag,
-                  window=window))
-          self.state_servicer.append_raw(key_iter_state_key, key)
-
-          kv_iter_state_key = beam_fn_api_pb2.StateKey(
-              multimap_keys_values_side_input=beam_fn_api_pb2.StateKey.
-              MultimapKeysValuesSideInput(
-                  transform_id=consuming_transform_id,
-                  side_input_id=tag,
-                  window=window))
-          self.state_servicer.append_raw(
+          multimap_side_input.window = window
+          multimap_side_input.key = key
+          append_raw(state_key, elements_data)
+
+          keys_by_window[window].append(key)
+          kv_chunks_by_window[window].append(
+              (key, _INT32_BIG_ENDIAN_PACK(elements_count), elements_data))
+
+        register_deferred_raw = self.state_servicer.register_deferred_raw
+        for window, keys in keys_by_window.items():
+          multimap_keys_side_input.window = window
+          # All of a window's keys are batched into a single state entry
+          # rather than one entry per key.
+          register_deferred_raw(
+              key_iter_state_key, functools.partial(_joined_keys_chunk, keys))
+        for window, kv_chunks in kv_chunks_by_window.items():
+          multimap_keys_values_side_input.window = window
+          register_deferred_raw(
               kv_iter_state_key,
-              # KV<K, Iterable<V>> encoding.
-              key + struct.pack('>i', elements_count) + elements_data)
+              # KV<K, Iterable<V>> encoding, joined only when requested.
+              functools.partial(_joined_kv_chunks, kv_chunks))
       else:
         raise ValueError("Unknown access pattern: '%s'" % func_spec.urn)
 
@@ -1038,6 +1312,16 @@ class BundleContextManager(object):
     self.num_workers = num_workers
     self.split_managers = split_managers
 
+    # Bound once: get_buffer runs per bundle and would otherwise repeat
+    # these attribute chains on every call.
+    self._pcoll_buffers = execution_context.pcoll_buffers
+    self._timer_buffers = execution_context.timer_buffers
+    # Grouping buffers may be deleted once consumed and recreated on later
+    # bundles; their (pre, post, windowing) parameters never change, so
+    # resolve them at most once per buffer id.
+    self._grouping_buffer_params = (
+        {})  # type: Dict[bytes, Tuple[coders.Coder, coders.Coder, Any]]
+
     # Properties that are lazily initialized
     self._process_bundle_descriptor = None  # type: Optional[beam_fn_api_pb2.ProcessBundleDescriptor]
     self._worker_handlers = None  # type: Optional[List[worker_handlers.WorkerHandler]]
@@ -1045,6 +1329,10 @@ class BundleContextManager(object):
     # is built after self._process_bundle_descriptor is initialized.
     # This field can be used to tell whether current bundle has timers.
     self._timer_coder_ids = None  # type: Optional[Dict[Tuple[str, str], str]]
+    # Maps each PCollection in the descriptor to its producing transform;
+    # built on first use by input_for.
+    self._producer_index = None  # type: Optional[Dict[str, Tuple[str, beam_runner_api_pb2.PTransform]]]
+    self._coder_impl_cache = {}  # type: Dict[str, CoderImpl]
 
     # A mapping from transform_name to Buffer ID
     self.stage_data_outputs: DataOutput = {}
@@ -1053,13 +1341,13 @@ class BundleContextManager(object):
     self._compute_expected_outputs()
 
   def _compute_expected_outputs(self) -> None:
-    for transform in self.stage.transforms:
-      if transform.spec.urn == bundle_processor.DATA_OUTPUT_URN:
-        buffer_id = transform.spec.payload
-        self.stage_data_outputs[transform.unique_name] = buffer_id
-      elif transform.spec.urn in translations.PAR_DO_URNS:
-        payload = proto_utils.parse_Bytes(
-            transform.spec.payload, beam_runner_api_pb2.ParDoPayload)
+    stage_transforms_by_urn = self.stage.transforms_by_urn
+    for transform in stage_transforms_by_urn[bundle_processor.DATA_OUTPUT_URN]:
+      buffer_id = transform.spec.payload
+      self.stage_data_outputs[transform.unique_name] = buffer_id
+    for urn in translations.PAR_DO_URNS:
+      for transform in stage_transforms_by_urn[urn]:
+        payload = _parse_pardo_payload(transform.spec.payload)
         for timer_family_id in payload.timer_family_specs.keys():
           time_domain = payload.timer_family_specs[timer_family_id].time_domain
           self.stage_timer_outputs[(transform.unique_name, timer_family_id)] = (
@@ -1098,23 +1386,105 @@ class BundleContextManager(object):
     # type: () -> beam_fn_api_pb2.ProcessBundleDescriptor
     # Cannot be invoked until *after* _extract_endpoints is called.
     # Always populate the timer_api_service_descriptor.
+    components = self.execution_context.pipeline_components
+    transforms = {
+        transform.unique_name: transform
+        for transform in self.stage.transforms
+    }
+    (pcoll_ids, coder_ids, windowing_strategy_ids,
+     environment_ids) = self._referenced_component_ids(transforms.values())
     return beam_fn_api_pb2.ProcessBundleDescriptor(
         id=self.bundle_uid,
-        transforms={
-            transform.unique_name: transform
-            for transform in self.stage.transforms
+        transforms=transforms,
+        pcollections={
+            pcoll_id: components.pcollections[pcoll_id]
+            for pcoll_id in pcoll_ids
+        },
+        coders={
+            coder_id: components.coders[coder_id]
+            for coder_id in coder_ids
+        },
+        windowing_strategies={
+            strategy_id: components.windowing_strategies[strategy_id]
+            for strategy_id in windowing_strategy_ids
+        },
+        environments={
+            env_id: components.environments[env_id]
+            for env_id in environment_ids
         },
-        pcollections=dict(
-            self.execution_context.pipeline_components.pcollections.items()),
-        coders=dict(self.execution_context.pipeline_components.coders.items()),
-        windowing_strategies=dict(
-            self.execution_context.pipeline_components.windowing_strategies.
-            items()),
-        environments=dict(
-            self.execution_context.pipeline_components.environments.items()),
         state_api_service_descriptor=self.state_api_service_descriptor(),
         timer_api_service_descriptor=self.data_api_service_descriptor())
 
+  def _referenced_component_ids(
+      self,
+      transforms  # type: Iterable[beam_runner_api_pb2.PTransform]
+  ):
+    # type: (...) -> Tuple[Set[str], Set[str], Set[str], Set[str]]
+
+    """Collects the component ids referenced by this stage's transforms.
+
+    Bundle descriptors used to embed every component of the whole pipeline;
+    only the transitive closure of what the stage's transforms touch is
+    needed by the SDK worker, and shipping just that keeps descriptor size
+    (and its serialization and parse cost) proportional to the stage rather
+    than the pipeline.
+    """
+    components = self.execution_context.pipeline_components
+    pcoll_ids = set()  # type: Set[str]
+    coder_ids_to_visit = []  # type: List[str]
+    environment_ids = set()  # type: Set[str]
+    if self.stage.environment:
+      environment_ids.add(self.stage.environment)
+    for transform in transforms:
+      pcoll_ids.update(transform.inputs.values())
+      pcoll_ids.update(transform.outputs.values())
+      if transform.environment_id:
+        environment_ids.add(transform.environment_id)
+      urn = transform.spec.urn
+      if urn in (bundle_processor.DATA_INPUT_URN,
+                 bundle_processor.DATA_OUTPUT_URN):
+        # By the time descriptors are built, setup() has rewritten these
+        # payloads into RemoteGrpcPorts carrying the data channel coder.
+        coder_ids_to_visit.append(
+            beam_fn_api_pb2.RemoteGrpcPort.FromString(
+                transform.spec.payload).coder_id)
+      elif urn in translations.PAR_DO_URNS:
+        payload = _parse_pardo_payload(transform.spec.payload)
+        if payload.restriction_coder_id:
+          coder_ids_to_visit.append(payload.restriction_coder_id)
+        for timer_spec in payload.timer_family_specs.values():
+          coder_ids_to_visit.append(timer_spec.timer_family_coder_id)
+        for state_spec in payload.state_specs.values():
+          spec_kind = state_spec.WhichOneof('spec')
+          if spec_kind:
+            for field, value in getattr(state_spec, spec_kind).ListFields():
+              if field.name.endswith('coder_id'):
+                coder_ids_to_visit.append(value)
+      elif urn in _COMBINE_PAYLOAD_URNS:
+        combine_payload = proto_utils.parse_Bytes(
+            transform.spec.payload, beam_runner_api_pb2.CombinePayload)
+        coder_ids_to_visit.append(combine_payload.accumulator_coder_id)
+
+    windowing_strategy_ids = set()  # type: Set[str]
+    for pcoll_id in pcoll_ids:
+      pcoll = components.pcollections[pcoll_id]
+      coder_ids_to_visit.append(pcoll.coder_id)
+      windowing_strategy_ids.add(pcoll.windowing_strategy_id)
+    for strategy_id in windowing_strategy_ids:
+      windowing_strategy = components.windowing_strategies[strategy_id]
+      coder_ids_to_visit.append(windowing_strategy.window_coder_id)
+      if windowing_strategy.environment_id:
+        environment_ids.add(windowing_strategy.environment_id)
+
+    coder_ids = set()  # type: Set[str]
+    while coder_ids_to_visit:
+      coder_id = coder_ids_to_visit.pop()
+      if coder_id and coder_id not in coder_ids:
+        coder_ids.add(coder_id)
+        coder_ids_to_visit.extend(
+            components.coders[coder_id].component_coder_ids)
+    return pcoll_ids, coder_ids, windowing_strategy_ids, environment_ids
+
   def get_input_coder_impl(self, transform_id):
     # type: (str) -> CoderImpl
     coder_id = beam_fn_api_pb2.RemoteGrpcPort.FromString(
@@ -1130,8 +1500,7 @@ class BundleContextManager(object):
     for transform_id, transform_proto in (self._process_bundle_descriptor
         .transforms.items()):
       if transform_proto.spec.urn == common_urns.primitives.PAR_DO.urn:
-        pardo_payload = proto_utils.parse_Bytes(
-            transform_proto.spec.payload, beam_runner_api_pb2.ParDoPayload)
+        pardo_payload = _parse_pardo_payload(transform_proto.spec.payload)
         for id, timer_family_spec in pardo_payload.timer_family_specs.items():
           timer_coder_ids[(transform_id, id)] = (
               timer_family_spec.timer_family_coder_id)
@@ -1139,11 +1508,15 @@ class BundleContextManager(object):
 
   def get_coder_impl(self, coder_id):
     # type: (str) -> CoderImpl
-    if coder_id in self.execution_context.safe_coders:
-      return self.execution_context.pipeline_context.coders[
-          self.execution_context.safe_coders[coder_id]].get_impl()
-    else:
-      return self.execution_context.pipeline_context.coders[coder_id].get_impl()
+    # Memoized: this runs on per-bundle setup paths and the safe-coder
+    # resolution plus get_impl() are the same for a given id every time.
+    impl = self._coder_impl_cache.get(coder_id)
+    if impl is None:
+      resolved_id = self.execution_context.safe_coders.get(coder_id, coder_id)
+      impl = self.execution_context.pipeline_context.coders[
+          resolved_id].get_impl()
+      self._coder_impl_cache[coder_id] = impl
+    return impl
 
   def get_timer_coder_impl(self, transform_id, timer_family_id):
     # type: (str, str) -> CoderImpl
@@ -1160,64 +1533,79 @@ class BundleContextManager(object):
     """
     kind, name = split_buffer_id(buffer_id)
     if kind == 'materialize':
-      if buffer_id not in self.execution_context.pcoll_buffers:
-        self.execution_context.pcoll_buffers[buffer_id] = ListBuffer(
+      pcoll_buffers = self._pcoll_buffers
+      if buffer_id not in pcoll_buffers:
+        pcoll_buffers[buffer_id] = ListBuffer(
             coder_impl=self.get_input_coder_impl(transform_id))
-      return self.execution_context.pcoll_buffers[buffer_id]
+      return pcoll_buffers[buffer_id]
     # For timer buffer, name = timer_family_id
     elif kind == 'timers':
-      if buffer_id not in self.execution_context.timer_buffers:
+      timer_buffers = self._timer_buffers
+      if buffer_id not in timer_buffers:
         timer_coder_impl = self.get_timer_coder_impl(transform_id, name)
-        self.execution_context.timer_buffers[buffer_id] = ListBuffer(
-            timer_coder_impl)
-      return self.execution_context.timer_buffers[buffer_id]
+        timer_buffers[buffer_id] = ListBuffer(timer_coder_impl)
+      return timer_buffers[buffer_id]
     elif kind == 'group':
       # This is a grouping write, create a grouping buffer if needed.
-      if buffer_id not in self.execution_context.pcoll_buffers:
-        original_gbk_transform = name
-        transform_proto = self.execution_context.pipeline_components.transforms[
-            original_gbk_transform]
-        input_pcoll = only_element(list(transform_proto.inputs.values()))
-        output_pcoll = only_element(list(transform_proto.outputs.values()))
-        pre_gbk_coder = self.execution_context.pipeline_context.coders[
-            self.execution_context.safe_coders[
-                self.execution_context.data_channel_coders[input_pcoll]]]
-        post_gbk_coder = self.execution_context.pipeline_context.coders[
-            self.execution_context.safe_coders[
-                self.execution_context.data_channel_coders[output_pcoll]]]
-        windowing_strategy = (
-            self.execution_context.pipeline_context.windowing_strategies[
-                self.execution_context.safe_windowing_strategies[
-                    self.execution_context.pipeline_components.
-                    pcollections[input_pcoll].windowing_strategy_id]])
-        self.execution_context.pcoll_buffers[buffer_id] = GroupingBuffer(
-            pre_gbk_coder, post_gbk_coder, windowing_strategy)
+      pcoll_buffers = self._pcoll_buffers
+      if buffer_id not in pcoll_buffers:
+        params = self._grouping_buffer_params.get(buffer_id)
+        if params is None:
+          execution_context = self.execution_context
+          pipeline_context = execution_context.pipeline_context
+          safe_coders = execution_context.safe_coders
+          data_channel_coders = execution_context.data_channel_coders
+          original_gbk_transform = name
+          transform_proto = execution_context.pipeline_components.transforms[
+              original_gbk_transform]
+          input_pcoll = only_element(list(transform_proto.inputs.values()))
+          output_pcoll = only_element(list(transform_proto.outputs.values()))
+          pre_gbk_coder = pipeline_context.coders[safe_coders[
+              data_channel_coders[input_pcoll]]]
+          post_gbk_coder = pipeline_context.coders[safe_coders[
+              data_channel_coders[output_pcoll]]]
+          windowing_strategy = pipeline_context.windowing_strategies[
+              execution_context.safe_windowing_strategies[
+                  execution_context.pipeline_components.
+                  pcollections[input_pcoll].windowing_strategy_id]]
+          params = (pre_gbk_coder, post_gbk_coder, windowing_strategy)
+          self._grouping_buffer_params[buffer_id] = params
+        pcoll_buffers[buffer_id] = GroupingBuffer(*params)
+      return pcoll_buffers[buffer_id]
     else:
       # These should be the only two identifiers we produce for now,
       # but special side input writes may go here.
       raise NotImplementedError(buffer_id)
-    return self.execution_context.pcoll_buffers[buffer_id]
+
+  def _transform_producer_index(
+      self) -> Dict[str, Tuple[str, beam_runner_api_pb2.PTransform]]:
+    if self._producer_index is None:
+      self._producer_index = {
+          output_pcoll: (transform_id, proto)
+          for transform_id,
+          proto in self.process_bundle_descriptor.transforms.items()
+          for output_pcoll in proto.outputs.values()
+      }
+    return self._producer_index
 
   def input_for(self, transform_id: str, input_id: str) -> str:
     """Returns the name of the transform producing the given PCollection."""
     input_pcoll = self.process_bundle_descriptor.transforms[
         transform_id].inputs[input_id]
-    for read_id, proto in self.process_bundle_descriptor.transforms.items():
+    producer_index = self._transform_producer_index()
+    producer = producer_index.get(input_pcoll)
+    if producer is not None:
+      read_id, proto = producer
       # The GrpcRead is followed by the SDF/Process.
-      if (proto.spec.urn == bundle_processor.DATA_INPUT_URN and
-          input_pcoll in proto.outputs.values()):
+      if proto.spec.urn == bundle_processor.DATA_INPUT_URN:
         return read_id
       # The GrpcRead is followed by the SDF/Truncate -> SDF/Process.
       if (proto.spec.urn ==
-          common_urns.sdf_components.TRUNCATE_SIZED_RESTRICTION.urn and
-          input_pcoll in proto.outputs.values()):
-        read_input = list(
-            self.process_bundle_descriptor.transforms[read_id].inputs.values()
-        )[0]
-        for (grpc_read,
-             transform_proto) in self.process_bundle_descriptor.transforms.items():  # pylint: disable=line-too-long
-          if (transform_proto.spec.urn == bundle_processor.DATA_INPUT_URN and
-              read_input in transform_proto.outputs.values()):
-            return grpc_read
+          common_urns.sdf_components.TRUNCATE_SIZED_RESTRICTION.urn):
+        read_input = next(iter(proto.inputs.values()))
+        grpc_read = producer_index.get(read_input)
+        if (grpc_read is not None and
+            grpc_read[1].spec.urn == bundle_processor.DATA_INPUT_URN):
+          return grpc_read[0]
 
     raise RuntimeError('No IO transform feeds %s' % transform_id)
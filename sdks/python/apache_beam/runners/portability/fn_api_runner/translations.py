@@ -154,6 +154,8 @@ class Stage(object):
           (self._extract_environment(t) for t in transforms))
     self.environment = environment
     self.forced_root = forced_root
+    # Lazily built by transforms_by_urn.
+    self._transforms_by_urn = None  # type: Optional[DefaultDict[str, List[beam_runner_api_pb2.PTransform]]]
 
   def __repr__(self):
     must_follow = ', '.join(prev.name for prev in self.must_follow)
@@ -171,6 +173,24 @@ class Stage(object):
         must_follow,
         downstream_side_inputs)
 
+  @property
+  def transforms_by_urn(self):
+    # type: () -> DefaultDict[str, List[beam_runner_api_pb2.PTransform]]
+
+    """This stage's transforms grouped by spec URN, built on first access.
+
+    Callers that dispatch on transform URNs (which never change after stage
+    construction) should prefer this over re-comparing URN strings per
+    transform. The index is invalidated if the transform list is rewritten.
+    """
+    if self._transforms_by_urn is None:
+      grouped = collections.defaultdict(
+          list)  # type: DefaultDict[str, List[beam_runner_api_pb2.PTransform]]
+      for transform in self.transforms:
+        grouped[transform.spec.urn].append(transform)
+      self._transforms_by_urn = grouped
+    return self._transforms_by_urn
+
   @staticmethod
   def _extract_environment(transform):
     # type: (beam_runner_api_pb2.PTransform) -> Optional[str]
@@ -273,6 +293,7 @@ class Stage(object):
         seen_pcolls.add(pcoll)
       new_transforms.append(transform)
     self.transforms = new_transforms
+    self._transforms_by_urn = None
 
   def executable_stage_transform(
       self,
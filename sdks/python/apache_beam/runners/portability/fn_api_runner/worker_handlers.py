@@ -862,6 +862,7 @@ class WorkerHandlerManager(object):
     self._workers_by_id = {}  # type: Dict[str, WorkerHandler]
     self.state_servicer = StateServicer()
     self._grpc_server = None  # type: Optional[GrpcServer]
+    self._lock = threading.Lock()
     self._process_bundle_descriptors = {
     }  # type: Dict[str, beam_fn_api_pb2.ProcessBundleDescriptor]
 
@@ -879,6 +880,17 @@ class WorkerHandlerManager(object):
       self,
       environment_id,  # type: Optional[str]
       num_workers  # type: int
+  ):
+    # type: (...) -> List[WorkerHandler]
+    # Guarded: stage setup may request handlers from several threads, and
+    # both the grpc server bring-up and the handler cache are shared.
+    with self._lock:
+      return self._get_worker_handlers(environment_id, num_workers)
+
+  def _get_worker_handlers(
+      self,
+      environment_id,  # type: Optional[str]
+      num_workers  # type: int
   ):
     # type: (...) -> List[WorkerHandler]
     if environment_id is None:
@@ -1021,6 +1033,9 @@ class StateServicer(beam_fn_api_pb2_grpc.BeamFnStateServicer,
     self._checkpoint = None  # type: Optional[StateServicer.StateType]
     self._use_continuation_tokens = False
     self._continuations = {}  # type: Dict[bytes, Tuple[bytes, ...]]
+    # Data registered via register_deferred_raw, keyed by the serialized
+    # state key, and only materialized into _state if the key is read.
+    self._deferred_raw = {}  # type: Dict[bytes, Callable[[], List[bytes]]]
 
   def checkpoint(self):
     # type: () -> None
@@ -1061,7 +1076,14 @@ class StateServicer(beam_fn_api_pb2_grpc.BeamFnStateServicer,
           'Unknown state type: ' + state_key.WhichOneof('type'))
 
     with self._lock:
-      full_state = self._state[self._to_key(state_key)]
+      key = self._to_key(state_key)
+      full_state = self._state[key]
+      deferred = self._deferred_raw.get(key)
+      if deferred is not None and not any(full_state):
+        # First read of a lazily registered key, or a re-read after the
+        # materialized copy was rolled back by restore().
+        for chunk in deferred():
+          full_state.append(chunk)
       if self._use_continuation_tokens:
         # The token is "nonce:index".
         if not continuation_token:
@@ -1090,11 +1112,27 @@ class StateServicer(beam_fn_api_pb2_grpc.BeamFnStateServicer,
       self._state[self._to_key(state_key)].append(data)
     return _Future.done()
 
+  def register_deferred_raw(
+      self,
+      state_key,  # type: beam_fn_api_pb2.StateKey
+      factory  # type: Callable[[], List[bytes]]
+  ):
+    # type: (...) -> None
+    """Registers state that is only materialized if state_key is ever read.
+
+    The factory may be re-run if the materialized copy is discarded by
+    restore(), so it must be pure over the data it captures.
+    """
+    with self._lock:
+      self._deferred_raw[self._to_key(state_key)] = factory
+
   def clear(self, state_key):
     # type: (beam_fn_api_pb2.StateKey) -> _Future
     with self._lock:
+      key = self._to_key(state_key)
+      self._deferred_raw.pop(key, None)
       try:
-        del self._state[self._to_key(state_key)]
+        del self._state[key]
       except KeyError:
         # This may happen with the caching layer across bundles. Caching may
         # skip this storage layer for a blocking_get(key) request. Without
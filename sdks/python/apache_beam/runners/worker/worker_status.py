@@ -17,13 +17,16 @@
 
 """Worker status api handler for reporting SDK harness debug info."""
 
+import heapq
 import logging
-import queue
+import operator
 import sys
 import threading
 import time
 import traceback
 from collections import defaultdict
+from collections import deque
+from concurrent import futures
 
 import grpc
 
@@ -52,25 +55,86 @@ LOG_LULL_FULL_THREAD_DUMP_INTERVAL_S = 20 * 60
 # Full thread dump is performed if the lull is more than 20 minutes.
 LOG_LULL_FULL_THREAD_DUMP_LULL_S = 20 * 60
 
+# A heap dump is recomputed at most this often.
+HEAP_DUMP_COOLDOWN_S = 60
 
-def thread_dump():
-  """Get a thread dump for the current SDK worker harness. """
-  # deduplicate threads with same stack trace
-  stack_traces = defaultdict(list)
-  frames = sys._current_frames()  # pylint: disable=protected-access
+# At most this many formatted lull stack traces are kept around.
+_STACK_TRACE_CACHE_SIZE = 128
+
+# Sort key for (instruction, descriptor_id, thread, time_since_transition).
+_time_since_transition = operator.itemgetter(3)
+
+# Bound once; called on every status request and lull tick.
+_current_frames = sys._current_frames  # pylint: disable=protected-access
+
+
+# Threads whose innermost frame is one of these well-known wait functions
+# (e.g. daemon pool threads parked in queue.get) carry no debugging signal
+# and may be summarized rather than dumped in full.
+_IDLE_FRAME_FILES = ('threading.py', 'queue.py')
+_IDLE_FRAME_NAMES = frozenset(['wait', '_bootstrap_inner', 'get'])
+
+
+def _is_idle_frame(frame):
+  code = frame.f_code
+  return (
+      code.co_filename.endswith(_IDLE_FRAME_FILES) and
+      code.co_name in _IDLE_FRAME_NAMES)
+
+
+def thread_dump(include_idle=True):
+  """Get a thread dump for the current SDK worker harness.
+
+  Args:
+    include_idle: whether to format full stacks for threads parked in
+      well-known wait functions. When False, such threads are counted and
+      reported in a single summary line, which keeps the dump cheap on
+      workers with many idle gRPC or bundle pool threads.
+  """
+  return '\n'.join(_thread_dump_lines(include_idle))
+
+
+def _thread_dump_lines(include_idle=True):
+  """Get the thread dump as a list of report lines."""
+  # Deduplicate threads with the same stack trace. Stacks are keyed on
+  # their (filename, lineno, name) triples rather than the formatted
+  # multi-KB string, so formatting (which also reads source lines) is paid
+  # at most once per unique stack.
+  threads_by_stack = defaultdict(list)
+  summary_by_stack = {}
+  frames = _current_frames()
+  idle_thread_count = 0
 
   for t in threading.enumerate():
     try:
-      stack_trace = ''.join(traceback.format_stack(frames[t.ident]))
+      frame = frames[t.ident]
     except KeyError:
       # the thread may have been destroyed already while enumerating, in such
       # case, skip to next thread.
       continue
-    thread_ident_name = (t.ident, t.name)
-    stack_traces[stack_trace].append(thread_ident_name)
+    if not include_idle and _is_idle_frame(frame):
+      idle_thread_count += 1
+      continue
+    stack_key = []
+    f = frame
+    while f is not None:
+      code = f.f_code
+      stack_key.append((code.co_filename, f.f_lineno, code.co_name))
+      f = f.f_back
+    stack_key = tuple(stack_key)
+    threads_by_stack[stack_key].append((t.ident, t.name))
+    if stack_key not in summary_by_stack:
+      # Snapshot the first stack of each kind as a StackSummary instead of
+      # holding a borrowed frame reference. lookup_lines=False defers the
+      # source-line reads to the one format() call per unique stack.
+      summary = traceback.StackSummary.extract(
+          traceback.walk_stack(frame), lookup_lines=False)
+      summary.reverse()
+      summary_by_stack[stack_key] = summary
 
   all_traces = ['=' * 10 + ' THREAD DUMP ' + '=' * 10]
-  for stack, identity in stack_traces.items():
+  for stack_key, identity in threads_by_stack.items():
+    stack = ''.join(summary_by_stack[stack_key].format())
     ident, name = identity[0]
     trace = '--- Thread #%s name: %s %s---\n' % (
         ident,
@@ -81,8 +145,12 @@ def thread_dump():
       trace += 'threads: %s\n' % identity
     trace += stack
     all_traces.append(trace)
+  if idle_thread_count:
+    all_traces.append(
+        '%d idle threads parked in wait functions omitted.' %
+        idle_thread_count)
   all_traces.append('=' * 30)
-  return '\n'.join(all_traces)
+  return all_traces
 
 
 def heap_dump():
@@ -97,19 +165,19 @@ def heap_dump():
 
 
 def _state_cache_stats(state_cache):
-  # type: (StateCache) -> str
+  # type: (StateCache) -> list
 
-  """Gather state cache statistics."""
+  """Gather state cache statistics as a list of report lines."""
   cache_stats = ['=' * 10 + ' CACHE STATS ' + '=' * 10]
   if not state_cache.is_cache_enabled():
     cache_stats.append("Cache disabled")
   else:
     cache_stats.append(state_cache.describe_stats())
-  return '\n'.join(cache_stats)
+  return cache_stats
 
 
 def _active_processing_bundles_state(bundle_process_cache):
-  """Gather information about the currently in-processing active bundles.
+  """Gather the in-processing active bundles as a list of report lines.
 
   The result only keeps the longest lasting 10 bundles to avoid excessive
   spamming.
@@ -119,9 +187,10 @@ def _active_processing_bundles_state(bundle_process_cache):
     active_bundles.append("No active processing bundles.")
   else:
     cache = []
-    for instruction in list(
-        bundle_process_cache.active_bundle_processors.keys()):
-      processor = bundle_process_cache.lookup(instruction)
+    # One snapshot of the items; the values already carry the processor, so
+    # there is no need for a locked lookup() per instruction.
+    for instruction, (_, processor) in list(
+        bundle_process_cache.active_bundle_processors.items()):
       if processor:
         info = processor.state_sampler.get_info()
         cache.append((
@@ -129,9 +198,9 @@ def _active_processing_bundles_state(bundle_process_cache):
             processor.process_bundle_descriptor.id,
             info.tracked_thread,
             info.time_since_transition))
-    # reverse sort active bundle by time since last transition, keep top 10.
-    cache.sort(key=lambda x: x[-1], reverse=True)
-    for s in cache[:10]:
+    # keep the top 10 active bundles by time since last transition; a
+    # bounded heap selection beats sorting the whole list.
+    for s in heapq.nlargest(10, cache, key=_time_since_transition):
       state = '--- instruction %s ---\n' % s[0]
       state += 'ProcessBundleDescriptorId: %s\n' % s[1]
       state += "tracked thread: %s\n" % s[2]
@@ -139,11 +208,17 @@ def _active_processing_bundles_state(bundle_process_cache):
       active_bundles.append(state)
 
   active_bundles.append('=' * 30)
-  return '\n'.join(active_bundles)
+  return active_bundles
 
 
 DONE = Sentinel.sentinel
 
+# Channel states in which assembling a status report is pointless because
+# the runner can no longer receive it.
+_DISCONNECTED_STATES = (
+    grpc.ChannelConnectivity.TRANSIENT_FAILURE,
+    grpc.ChannelConnectivity.SHUTDOWN)
+
 
 class FnApiWorkerStatusHandler(object):
   """FnApiWorkerStatusHandler handles worker status request from Runner. """
@@ -166,17 +241,33 @@ class FnApiWorkerStatusHandler(object):
     self._state_cache = state_cache
     ch = GRPCChannelFactory.insecure_channel(status_address)
     grpc.channel_ready_future(ch).result(timeout=60)
+    self._channel_connectivity = grpc.ChannelConnectivity.READY
+    ch.subscribe(self._on_connectivity_change)
     self._status_channel = grpc.intercept_channel(ch, WorkerIdInterceptor())
     self._status_stub = beam_fn_api_pb2_grpc.BeamFnWorkerStatusStub(
         self._status_channel)
-    self._responses = queue.Queue()
+    # With a single consumer (_get_responses), an atomic deque plus an Event
+    # is cheaper per message than queue.Queue's monitor.
+    self._responses = deque()
+    self._responses_available = threading.Event()
+    self._shutdown_event = threading.Event()
     self.log_lull_timeout_ns = log_lull_timeout_ns
+    self._log_lull_timeout_s = log_lull_timeout_ns / 1e9
     self._last_full_thread_dump_secs = 0.0
     self._last_lull_logged_secs = 0.0
+    self._stack_trace_cache = {}  # type: dict
     self._server = threading.Thread(
         target=lambda: self._serve(), name='fn_api_status_handler')
     self._server.daemon = True
     self._enable_heap_dump = enable_heap_dump
+    if enable_heap_dump:
+      # Heap dumps can take many seconds, so they are computed on their own
+      # thread and the status RPC thread only reads the cached result.
+      self._heap_dump_lock = threading.Lock()
+      self._heap_dump_in_progress = False
+      self._last_heap_dump = ''
+      self._last_heap_dump_secs = 0.0
+      self._heap_dump_executor = futures.ThreadPoolExecutor(max_workers=1)
     self._server.start()
     self._lull_logger = threading.Thread(
         target=lambda: self._log_lull_in_bundle_processor(
@@ -185,60 +276,123 @@ class FnApiWorkerStatusHandler(object):
     self._lull_logger.daemon = True
     self._lull_logger.start()
 
+  def _put_response(self, response):
+    self._responses.append(response)
+    self._responses_available.set()
+
   def _get_responses(self):
+    responses = self._responses
+    available = self._responses_available
     while True:
-      response = self._responses.get()
-      if response is DONE:
-        self._alive = False
-        return
-      yield response
+      while not responses:
+        available.wait()
+        available.clear()
+      # Drain whatever is already queued before blocking again, so a burst
+      # of responses can be aggregated into fewer stream writes.
+      while responses:
+        response = responses.popleft()
+        if response is DONE:
+          self._alive = False
+          return
+        yield response
+
+  def _on_connectivity_change(self, connectivity):
+    self._channel_connectivity = connectivity
 
   def _serve(self):
     while self._alive:
       for request in self._status_stub.WorkerStatus(self._get_responses()):
+        if self._channel_connectivity in _DISCONNECTED_STATES:
+          # The runner is gone; answer with an empty status rather than
+          # walking every thread for a report nobody can read.
+          self._put_response(
+              beam_fn_api_pb2.WorkerStatusResponse(id=request.id))
+          continue
         try:
-          self._responses.put(
+          self._put_response(
               beam_fn_api_pb2.WorkerStatusResponse(
                   id=request.id, status_info=self.generate_status_response()))
         except Exception:
           traceback_string = traceback.format_exc()
-          self._responses.put(
+          self._put_response(
               beam_fn_api_pb2.WorkerStatusResponse(
                   id=request.id,
                   error="Exception encountered while generating "
                   "status page: %s" % traceback_string))
 
   def generate_status_response(self):
-    all_status_sections = []
+    # Sections contribute individual lines so the full report is joined
+    # (and copied) only once.
+    all_status_lines = []
 
     if self._state_cache:
-      all_status_sections.append(_state_cache_stats(self._state_cache))
+      all_status_lines.extend(_state_cache_stats(self._state_cache))
 
     if self._bundle_process_cache:
-      all_status_sections.append(
+      all_status_lines.extend(
           _active_processing_bundles_state(self._bundle_process_cache))
 
-    all_status_sections.append(thread_dump())
+    all_status_lines.extend(_thread_dump_lines(include_idle=False))
     if self._enable_heap_dump:
-      all_status_sections.append(heap_dump())
+      all_status_lines.append(self._cached_heap_dump())
+
+    return '\n'.join(all_status_lines)
 
-    return '\n'.join(all_status_sections)
+  def _cached_heap_dump(self):
+    """Returns the latest heap dump, refreshing it in the background.
+
+    Walking the heap with guppy can take many seconds; doing it on the
+    status RPC thread would stall the bidi stream, so the dump is
+    recomputed at most once per cooldown on a dedicated thread and the
+    cached result is returned immediately.
+    """
+    with self._heap_dump_lock:
+      now = time.time()
+      if (not self._heap_dump_in_progress and
+          now - self._last_heap_dump_secs > HEAP_DUMP_COOLDOWN_S):
+        self._heap_dump_in_progress = True
+        self._heap_dump_executor.submit(self._refresh_heap_dump)
+      heap = self._last_heap_dump
+    return heap or 'Heap dump pending, check back on the next request.\n'
+
+  def _refresh_heap_dump(self):
+    try:
+      dump = heap_dump()
+    except Exception:  # pylint: disable=broad-except
+      dump = 'Failed to generate heap dump: %s' % traceback.format_exc()
+    with self._heap_dump_lock:
+      self._last_heap_dump = dump
+      self._last_heap_dump_secs = time.time()
+      self._heap_dump_in_progress = False
 
   def close(self):
-    self._responses.put(DONE, timeout=5)
+    self._shutdown_event.set()
+    self._put_response(DONE)
+    if self._enable_heap_dump:
+      self._heap_dump_executor.shutdown(wait=False)
 
   def _log_lull_in_bundle_processor(self, bundle_process_cache):
-    while True:
-      time.sleep(2 * 60)
-      if bundle_process_cache and bundle_process_cache.active_bundle_processors:
-        for instruction in list(
-            bundle_process_cache.active_bundle_processors.keys()):
-          processor = bundle_process_cache.lookup(instruction)
-          if processor:
-            info = processor.state_sampler.get_info()
-            self._log_lull_sampler_info(info, instruction)
-
-  def _log_lull_sampler_info(self, sampler_info, instruction):
+    # The wait doubles as the 2-minute tick and as a shutdown hook: close()
+    # sets the event, waking the logger immediately instead of leaving it
+    # asleep for up to the full interval.
+    while not self._shutdown_event.wait(2 * 60):
+      if not (bundle_process_cache and
+              bundle_process_cache.active_bundle_processors):
+        continue
+      if time.time() - self._last_lull_logged_secs <= self._log_lull_timeout_s:
+        # Still inside the last log's quiet window; every per-bundle probe
+        # would be discarded by the throttle, so don't take them at all.
+        continue
+      # One frames snapshot is shared by all active bundles this tick;
+      # sys._current_frames() walks every thread per call.
+      frames = _current_frames()
+      for instruction, (_, processor) in list(
+          bundle_process_cache.active_bundle_processors.items()):
+        if processor:
+          info = processor.state_sampler.get_info()
+          self._log_lull_sampler_info(info, instruction, frames=frames)
+
+  def _log_lull_sampler_info(self, sampler_info, instruction, frames=None):
     if not self._passed_lull_timeout_since_last_log():
       return
     if (sampler_info and sampler_info.time_since_transition and
@@ -253,7 +407,7 @@ class FnApiWorkerStatusHandler(object):
       else:
         step_name_log = ''
 
-      stack_trace = self._get_stack_trace(sampler_info)
+      stack_trace = self._get_stack_trace(sampler_info, frames=frames)
 
       _LOGGER.warning(
           (
@@ -266,19 +420,45 @@ class FnApiWorkerStatusHandler(object):
           stack_trace,
       )
 
-  def _get_stack_trace(self, sampler_info):
+  def _get_stack_trace(self, sampler_info, frames=None):
     exec_thread = getattr(sampler_info, 'tracked_thread', None)
     if exec_thread is not None:
-      thread_frame = sys._current_frames().get(exec_thread.ident)  # pylint: disable=protected-access
-      return '\n'.join(
-          traceback.format_stack(thread_frame)) if thread_frame else ''
+      if frames is None:
+        frames = _current_frames()
+      thread_frame = frames.get(exec_thread.ident)
+      if not thread_frame:
+        return ''
+      # Snapshot the stack as (filename, lineno, name) triples in one walk
+      # and drop the borrowed frame reference right away; the frames belong
+      # to a live thread and should not be kept across the formatting work.
+      snapshot = []
+      f = thread_frame
+      while f is not None:
+        code = f.f_code
+        snapshot.append((code.co_filename, f.f_lineno, code.co_name, None))
+        f = f.f_back
+      # A truly stuck thread produces an identical snapshot across lull
+      # scans; key the cache on the snapshot content so the formatted stack
+      # is reused without pinning (or trusting the address of) any frame.
+      cache_key = tuple(snapshot)
+      del thread_frame, f
+      stack = self._stack_trace_cache.get(cache_key)
+      if stack is None:
+        snapshot.reverse()
+        stack = '\n'.join(
+            traceback.StackSummary.from_list(snapshot).format())
+        if len(self._stack_trace_cache) >= _STACK_TRACE_CACHE_SIZE:
+          # Evict the oldest entry; insertion order doubles as FIFO.
+          del self._stack_trace_cache[next(iter(self._stack_trace_cache))]
+        self._stack_trace_cache[cache_key] = stack
+      return stack
     else:
       return '-NOT AVAILABLE-'
 
   def _passed_lull_timeout_since_last_log(self) -> bool:
-    if (time.time() - self._last_lull_logged_secs >
-        self.log_lull_timeout_ns / 1e9):
-      self._last_lull_logged_secs = time.time()
+    now = time.time()
+    if now - self._last_lull_logged_secs > self._log_lull_timeout_s:
+      self._last_lull_logged_secs = now
       return True
     else:
       return False